@@ -4,21 +4,38 @@
 Enhanced with power management, services detection, and improved interface
 """
 
+import asyncio
+import http.client
 import http.server
 import socketserver
+import io
 import json
 import os
 import platform
+import queue
+import re
+import select
 import subprocess
-import urllib.request
 import urllib.parse
 import threading
 import socket
+import stat
+import sys
 import time
 import psutil
 import hashlib
 import secrets
+import shutil
 import base64
+import gzip
+import email.utils
+import fnmatch
+import collections
+import array
+import mmap
+import struct
+import heapq
+import concurrent.futures
 from http.cookies import SimpleCookie
 
 # Configuration
@@ -35,6 +52,45 @@ CONFIG = {
         "admin": "changeme"  # Will be set during installation
     },
     "session_timeout": 3600,  # 1 hour
+    "sample_interval": 2,  # seconds between background metric samples
+    "history_dir": os.path.join(os.path.dirname(os.path.abspath(__file__)), "history"),  # None keeps history in memory only
+    "history_max_mb": 64,  # on-disk history size cap; oldest segments go first
+    "history_open_maps": 128,  # writable segment maps kept open across all metrics and tiers
+    "network_exclude": ["lo", "veth"],  # interface name prefixes left out of network totals and rates
+    "mount_scan_interval": 30,  # seconds between per-mount usage refreshes
+    "disk_include": [],  # fnmatch patterns on mountpoints/device names; empty means all
+    "disk_exclude": ["/snap/*", "/boot/efi", "loop*", "ram*", "zram*"],
+    "disk_exclude_fstypes": ["squashfs", "overlay", "tmpfs", "devtmpfs", "nfs", "nfs4", "cifs", "smbfs", "fuse.sshfs"],
+    "disk_max_entries": 32,  # cap on mounts and on devices in each payload
+    "process_table_interval": 10,  # seconds between full process walks for /api/processes
+    "process_fd_interval": 30,  # seconds between open descriptor counts of service processes
+    "cgroup_root": "/sys/fs/cgroup",  # cgroup v2 mount; unit/container accounting is skipped without it
+    "cgroup_scan_interval": 30,  # seconds between rediscovery of units and container scopes
+    "cgroup_max_groups": 64,  # cap on tracked units plus containers
+    "proc_fast_path": True,  # read core host counters straight from /proc on Linux (psutil otherwise)
+    "peer_workers": 8,  # max concurrent peer requests
+    "aggregation_timeout": 4,  # overall deadline (seconds) for one cluster aggregation
+    "port_scan_interval": 10,  # seconds between listening port scans for service detection
+    "stream_interval": 5,  # seconds between /api/stream cluster snapshots
+    "stream_heartbeat": 15,  # seconds of silence before an SSE heartbeat comment
+    "delta_keyframe_interval": 12,  # delta streams resend a full keyframe every N updates; polls this many versions behind get one
+    "server_mode": "threaded",  # "threaded" or "asyncio"
+    "async_workers": 16,  # executor threads for request handlers in asyncio mode
+    "worker_threads": 16,  # fixed request worker pool in threaded mode
+    "accept_queue": 64,  # connections waiting for a worker before new ones get 503
+    "endpoint_limits": {  # concurrent requests per endpoint class before 503
+        "read": 12,  # local metrics, info, pages, static files
+        "aggregate": 4,  # cluster refreshes that fan out to peers (cache hits and waiters don't count)
+        "control": 2,  # power/shutdown/reboot/sleep POSTs
+        "stream": 4,  # SSE clients, each holding a worker in threaded mode
+    },
+    "retry_after": 2,  # Retry-After seconds on 503 responses
+    "keepalive_timeout": 15,  # seconds an idle HTTP/1.1 connection stays open
+    "cluster_cache_ttl": 2,  # seconds an aggregated cluster snapshot is reused
+    "breaker_threshold": 2,  # consecutive peer failures before its circuit opens
+    "breaker_backoff": 2,  # first background re-probe delay in seconds, doubled per failure
+    "breaker_backoff_max": 60,  # cap on the re-probe delay
+    "breaker_probe_timeout": 2,  # seconds a background /api/health re-probe may take
     "other_nodes": [
         {"name": "GASPAR", "ip": "127.0.0.1", "port": 8080},
         {"name": "MELCHIOR", "ip": "127.0.0.1", "port": 8081},
@@ -42,6 +98,10 @@ CONFIG = {
     ]
 }
 
+# Response compression
+GZIP_MIN_BYTES = 1024  # smaller bodies are not worth compressing
+GZIP_LEVEL = 6
+
 # Session management
 ACTIVE_SESSIONS = {}
 SESSION_CLEANUP_INTERVAL = 300  # 5 minutes
@@ -68,42 +128,123 @@ def start_session_cleanup():
     threading.Timer(SESSION_CLEANUP_INTERVAL, start_session_cleanup).start()
 
 class MAGIHandler(http.server.SimpleHTTPRequestHandler):
+    # Persistent connections; every response carries Content-Length or closes the connection
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; with Nagle on, kept-alive
+    # connections would stall ~40 ms per response on the client's delayed ACK
+    disable_nagle_algorithm = True
+    # Socket timeout so a silent client cannot pin a pool worker
+    timeout = 30
+
+    def handle(self):
+        """Serve requests on one connection, keeping it open between requests"""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self.wait_for_next_request():
+                break
+            self.handle_one_request()
+
+    def wait_for_next_request(self):
+        """Wait up to keepalive_timeout for the next request; False to close the connection"""
+        # A pipelined request read along with the last one sits in rfile, where select cannot see it
+        if self.request_buffered():
+            return True
+        deadline = time.monotonic() + CONFIG.get('keepalive_timeout', 15)
+        pending = getattr(self.server, 'pending', None)
+        while True:
+            # Hand the worker back as soon as other connections are queued for it
+            if pending is not None and not pending.empty():
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                readable, _, _ = select.select([self.connection], [], [], min(1.0, remaining))
+            except (OSError, ValueError):
+                return False
+            if readable:
+                return True
+
+    def request_buffered(self):
+        """True if rfile already holds bytes of the next request"""
+        # peek() only reads the socket when the buffer is empty; non-blocking, that read cannot stall
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
     def do_GET(self):
         """Handle HTTP GET requests"""
-        # Check web UI authentication for main page
-        if self.path == "/" or self.path.startswith('/dashboard'):
-            if CONFIG.get('require_login') and not self.check_session():
-                self.serve_login_page()
-                return
-                
-        # Enforce API auth for /api/ endpoints if enabled
-        if CONFIG.get('require_api_key') and self.path.startswith('/api'):
-            if not self.check_api_auth():
-                return
-                
-        if self.path == "/":
+        path = self.parse_target()
+        if path == "/api/health":
+            # Liveness answers before auth and admission so it stays cheap under load
+            self.serve_health()
+            return
+        if not self.authorize_get(path):
+            return
+
+        self.run_admitted(GET_ENDPOINT_CLASSES.get(path, 'read'), self.route_get, path)
+
+    def route_get(self, path):
+        """Dispatch an authorized GET request"""
+        if path == "/":
             self.serve_main_page()
-        elif self.path == "/login":
+        elif path == "/login":
             self.serve_login_page()
-        elif self.path == "/logout":
+        elif path == "/logout":
             self.handle_logout()
-        elif self.path == "/api/metrics":
+        elif path == "/api/metrics":
             self.serve_metrics()
-        elif self.path == "/api/all-metrics":
+        elif path == "/api/all-metrics":
             self.serve_all_metrics()
-        elif self.path == "/api/stream":
+        elif path == "/api/stream":
             self.serve_stream()
-        elif self.path == "/api/nodes":
+        elif path == "/api/nodes":
             self.serve_nodes()
-        elif self.path == "/api/services":
+        elif path == "/api/services":
             self.serve_all_services()
-        elif self.path == "/api/info":
+        elif path == "/api/info":
             self.serve_info()
-        elif self.path.startswith("/images/"):
+        elif path == "/api/history":
+            self.serve_history()
+        elif path == "/api/processes":
+            self.serve_processes()
+        elif path.startswith("/static/"):
+            self.serve_static(path)
+        elif path.startswith("/images/"):
             self.serve_image()
         else:
             self.send_error(404, "Not Found")
     
+    def do_HEAD(self):
+        """Handle HTTP HEAD requests with GET's routing, status and headers but no body"""
+        self.do_GET()
+
+    def parse_target(self):
+        """Split the request target into its path and query parameters"""
+        parsed = urllib.parse.urlsplit(self.path)
+        self.query = urllib.parse.parse_qs(parsed.query)
+        return parsed.path
+
+    def authorize_get(self, path):
+        """Apply login and API key checks for a GET path; on failure the response is already sent"""
+        # Check web UI authentication for main page
+        if path == "/" or path.startswith('/dashboard'):
+            if CONFIG.get('require_login') and not self.check_session():
+                self.serve_login_page()
+                return False
+                
+        # Enforce API auth for /api/ endpoints if enabled
+        if CONFIG.get('require_api_key') and path.startswith('/api'):
+            if not self.check_api_auth():
+                return False
+
+        return True
+    
     def do_POST(self):
         """Handle HTTP POST requests for system control"""
         # Handle login requests
@@ -120,6 +261,11 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
         if CONFIG.get('require_api_key') and self.path.startswith('/api'):
             if not self.check_api_auth():
                 return
+
+        self.run_admitted('control', self.handle_control)
+
+    def handle_control(self):
+        """Dispatch an authorized system control POST"""
         content_length = int(self.headers.get('Content-Length', 0))
         post_data = self.rfile.read(content_length)
         
@@ -154,6 +300,33 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
         else:
             self.send_error(404, "Not Found")
 
+    def run_admitted(self, endpoint_class, func, *args):
+        """Run func within the endpoint class concurrency limit, or answer 503 straight away"""
+        if not ADMISSION.acquire(endpoint_class):
+            self.send_overloaded(endpoint_class)
+            return
+        try:
+            func(*args)
+        finally:
+            ADMISSION.release(endpoint_class)
+
+    def send_overloaded(self, endpoint_class):
+        """Reject a request whose endpoint class is at its concurrency limit"""
+        body = json.dumps({
+            "status": "error",
+            "message": f"Too many concurrent {endpoint_class} requests, retry later"
+        }, separators=(',', ':')).encode('utf-8')
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Retry-After', str(CONFIG.get('retry_after', 2)))
+        self.send_header('Cache-Control', 'no-store')
+        # A rejected POST body is never read, so the connection can't be reused
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
     def check_api_auth(self):
         """Validate Authorization header when API key enforcement is enabled."""
         auth = self.headers.get('Authorization') or self.headers.get('authorization')
@@ -231,6 +404,7 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_response(302)
                 self.send_header('Location', '/')
                 self.send_header('Set-Cookie', f'magi_session={session_id}; Path=/; HttpOnly; SameSite=Strict')
+                self.send_header('Content-Length', '0')
                 self.end_headers()
             else:
                 # Invalid credentials - show login page with error
@@ -253,21 +427,29 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
         self.send_response(302)
         self.send_header('Location', '/login')
         self.send_header('Set-Cookie', 'magi_session=; Path=/; HttpOnly; SameSite=Strict; Expires=Thu, 01 Jan 1970 00:00:00 GMT')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def serve_login_page(self, error=None):
         """Serve the login page"""
+        if not error:
+            self.serve_asset(get_static_asset('/login'))
+            return
+
+        html = self.render_login_page(get_static_assets(), error)
+        self.send_body(html.encode('utf-8'), 'text/html; charset=utf-8', cache_control='no-store')
+
+    def render_login_page(self, assets, error=None):
+        """Render the login page HTML, linking the pre-rendered login stylesheet"""
         error_html = f'<div class="error-message">{error}</div>' if error else ''
         
-        html = f"""<!DOCTYPE html>
+        return f"""<!DOCTYPE html>
 <html>
 <head>
     <title>MAGI Login - {CONFIG['node_name']}</title>
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        {self.get_login_css()}
-    </style>
+    <link rel="stylesheet" href="/static/login.css?v={assets['/static/login.css'].version}">
 </head>
 <body>
     <div class="login-container">
@@ -297,11 +479,6 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
     </div>
 </body>
 </html>"""
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
     
     def get_login_css(self):
         """CSS for login page"""
@@ -439,11 +616,21 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
     
     def serve_main_page(self):
         """Serve the main MAGI dashboard"""
-        html = self.get_magi_html()
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+        self.serve_asset(get_static_asset('/'))
+
+    def serve_static(self, path):
+        """Serve pre-rendered CSS/JS assets"""
+        asset = get_static_asset(path)
+        if asset is None:
+            self.send_error(404, "Not Found")
+            return
+        self.serve_asset(asset)
+
+    def serve_asset(self, asset):
+        """Send a pre-rendered asset with its ETag, gzip variant and cache policy"""
+        self.send_body(asset.body, asset.content_type, etag=asset.etag, gzipped=asset.gzipped,
+                       cache_control=asset.cache_control, last_modified=asset.last_modified,
+                       compress=asset.gzipped is not None)
     
     def serve_metrics(self):
         """Serve system metrics as JSON"""
@@ -451,35 +638,60 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
             metrics = get_system_metrics()
         except Exception:
             metrics = get_system_metrics_fallback()
-        self.send_json(metrics)
+
+        # Revalidate by sample rather than by body, which changes with sample_age on every read
+        if 'sampled_at' in metrics and not self.query_flag('delta'):
+            style = 'pretty' if self.query_flag('pretty') else 'compact'
+            self.send_json(metrics, etag=f'"sample-{metrics["sampled_at"]}-{style}"')
+            return
+        self.send_snapshot(metrics, METRICS_DELTA)
     
     def serve_all_metrics(self):
         """Serve aggregated metrics from all nodes as JSON"""
         try:
             all_metrics = gather_all_metrics()
-            self.send_json(all_metrics)
+            # Peer timestamps and sample ages change every tick, so a body hash would never match
+            self.send_snapshot(all_metrics, ALL_METRICS_DELTA, etag=False)
+        except AdmissionRejected as e:
+            self.send_overloaded(e.endpoint_class)
         except Exception as e:
             self.send_error(500, f"Error gathering all metrics: {e}")
     
     def serve_stream(self):
-        """Serve Server-Sent Events stream for real-time metrics"""
+        """Serve a long-lived Server-Sent Events stream of cluster snapshots"""
+        if self.command == 'HEAD':
+            self.start_stream()
+            return
+
+        heartbeat = CONFIG.get('stream_heartbeat', 15)
+        subscriber = CLUSTER_BROADCASTER.subscribe(self.headers.get('Last-Event-ID'), self.query_flag('delta'))
         try:
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'keep-alive')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            # Send initial data
-            all_metrics = gather_all_metrics()
-            data = json.dumps(all_metrics)
-            self.wfile.write(f"data: {data}\n\n".encode('utf-8'))
+            self.start_stream()
             self.wfile.flush()
-            
-        except Exception as e:
-            print(f"SSE stream error: {e}")
-            self.send_error(500, f"Stream error: {e}")
+
+            # A client that stops reading for too long is dropped instead of pinning this thread
+            self.connection.settimeout(heartbeat * 2)
+            while True:
+                events = subscriber.wait(heartbeat)
+                self.wfile.write(b''.join(events) if events else b': heartbeat\n\n')
+                self.wfile.flush()
+        except OSError:
+            # Client disconnected or stalled
+            pass
+        finally:
+            CLUSTER_BROADCASTER.unsubscribe(subscriber)
+    
+    def start_stream(self):
+        """Write the SSE response headers and reconnect delay"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # The event stream has no length, so it ends with the connection
+        self.send_header('Connection', 'close')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(f"retry: {CLUSTER_BROADCASTER.RETRY_MS}\n\n".encode('utf-8'))
     
     def create_simulated_metrics(self, node_name):
         """Create simulated metrics for demo purposes"""
@@ -501,10 +713,7 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
                 "used": f"{random.randint(100, 800)} GB", 
                 "total": "1 TB"
             },
-            "network": {
-                "upload": f"{random.randint(10, 100)} MB/s",
-                "download": f"{random.randint(20, 200)} MB/s"
-            },
+            "network": simulated_network_metrics(random.uniform(10, 100), random.uniform(20, 200)),
             "temperature": {
                 "CPU": {"current": random.randint(45, 75)},
                 "GPU": {"current": random.randint(40, 85)}
@@ -518,30 +727,18 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
         try:
             nodes = discover_nodes()
             self.send_json(nodes)
+        except AdmissionRejected as e:
+            self.send_overloaded(e.endpoint_class)
         except Exception as e:
             self.send_error(500, f"Error discovering nodes: {e}")
     
     def serve_all_services(self):
         """Serve comprehensive services from all nodes"""
         try:
-            all_services = {}
-            nodes = discover_nodes()
-            
-            for node in nodes:
-                node_name = node["name"]
-                node_services = node.get("services", {})
-                
-                # Añadir información del nodo a cada servicio
-                for service_name, service_info in node_services.items():
-                    service_key = f"{service_name}@{node_name}"
-                    all_services[service_key] = {
-                        **service_info,
-                        "node": node_name,
-                        "node_ip": node["ip"],
-                        "node_status": node["status"]
-                    }
-            
+            all_services = gather_all_services()
             self.send_json(all_services)
+        except AdmissionRejected as e:
+            self.send_overloaded(e.endpoint_class)
         except Exception as e:
             self.send_error(500, f"Error getting services: {e}")
     
@@ -595,66 +792,251 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, f"Error putting system to sleep: {e}")
     
+    def serve_history(self):
+        """Serve recorded history for one metric, or the list of recorded metrics"""
+        metric = self.query_value('metric')
+        if not metric:
+            self.send_json({
+                "metrics": METRIC_HISTORY.metric_names(),
+                "tiers": [{"name": name, "step": step, "retention": retention}
+                          for name, step, retention in METRIC_HISTORY.tiers()]
+            })
+            return
+
+        try:
+            now = time.time()
+            end = float(self.query_value('to', now))
+            start = float(self.query_value('from', end - 3600))
+            step = float(self.query_value('step', 0))
+        except ValueError:
+            self.send_error(400, "from, to and step must be numbers")
+            return
+        # Non-positive times are relative to now (from=-86400 is the last day)
+        if end <= 0:
+            end += now
+        if start <= 0:
+            start += now
+
+        history = METRIC_HISTORY.query(metric, start, end, step, now)
+        if history is None:
+            self.send_error(404, f"Unknown metric: {metric}")
+            return
+        self.send_json(history)
+
+    def serve_processes(self):
+        """Serve the top processes from the sampler's process table"""
+        sort = self.query_value('sort', 'cpu')
+        if sort not in ProcessTable.SORT_KEYS:
+            self.send_error(400, "sort must be one of: cpu, mem, io")
+            return
+        try:
+            top = max(1, min(200, int(self.query_value('top', 20))))
+        except ValueError:
+            self.send_error(400, "top must be an integer")
+            return
+        self.send_json(PROCESS_TABLE.top(top, sort))
+
+    def serve_health(self):
+        """Serve a minimal liveness response without touching metrics"""
+        body = health_body()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
     def serve_info(self):
         """Serve node info as JSON"""
         info = {
             "node_name": CONFIG["node_name"],
             "platform": platform.platform(),
             "python_version": platform.python_version(),
-            "uptime": "unknown"
+            "uptime": "unknown",
+            "admission": ADMISSION.stats(),
+            "peers": PEER_POOL.stats(),
+            "breakers": PEER_BREAKER.stats()
         }
         self.send_json(info)
     
     def serve_image(self):
         """Serve images from the images directory"""
         try:
-            # Extract filename from path
-            filename = self.path.split('/')[-1]
-            image_path = os.path.join(os.path.dirname(__file__), "images", filename)
-            
-            if os.path.exists(image_path):
-                with open(image_path, 'rb') as f:
-                    image_data = f.read()
-                
-                # Determine content type
-                if filename.endswith('.png'):
-                    content_type = 'image/png'
-                elif filename.endswith('.jpg') or filename.endswith('.jpeg'):
-                    content_type = 'image/jpeg'
-                elif filename.endswith('.svg'):
-                    content_type = 'image/svg+xml'
-                else:
-                    content_type = 'application/octet-stream'
-                
-                self.send_response(200)
-                self.send_header('Content-type', content_type)
-                self.send_header('Content-length', len(image_data))
-                self.end_headers()
-                self.wfile.write(image_data)
-            else:
+            # Only plain file names inside images/ are served
+            filename = os.path.basename(urllib.parse.unquote(urllib.parse.urlsplit(self.path).path))
+            image_path = os.path.join(IMAGES_DIR, filename)
+            try:
+                st = os.stat(image_path) if filename and not filename.startswith('.') else None
+            except OSError:
+                st = None
+
+            if st is None or not stat.S_ISREG(st.st_mode):
                 self.send_error(404, "Image not found")
+                return
+
+            asset = IMAGE_CACHE.get(image_path, st)
+            if asset is not None:
+                self.serve_asset(asset)
+            else:
+                self.send_file(image_path, st)
         except Exception as e:
             print(f"Error serving image: {e}")
             self.send_error(500, "Internal server error")
+
+    def send_file(self, path, st):
+        """Stream a large file from disk with sendfile instead of reading it into memory"""
+        etag = file_etag(st)
+        last_modified = int(st.st_mtime)
+        if self.not_modified(etag, last_modified):
+            self.send_not_modified(etag, IMAGE_CACHE_CONTROL, last_modified)
+            return
+
+        extension = os.path.splitext(path)[1].lower()
+        with open(path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-type', IMAGE_CONTENT_TYPES.get(extension, 'application/octet-stream'))
+            self.send_header('Content-Length', str(st.st_size))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', email.utils.formatdate(last_modified, usegmt=True))
+            self.send_header('Cache-Control', IMAGE_CACHE_CONTROL)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.write_file(f, st.st_size)
+
+    def write_file(self, f, size):
+        """Send size bytes of an open file after the headers"""
+        if isinstance(self.connection, socket.socket):
+            self.wfile.flush()
+            self.connection.sendfile(f, 0, size)
+        else:
+            shutil.copyfileobj(f, self.wfile)
     
-    def send_json(self, data):
-        """Send JSON response"""
+    def query_value(self, name, default=None):
+        """First value of a query parameter, or default"""
+        return getattr(self, 'query', {}).get(name, [default])[0]
+
+    def query_flag(self, name):
+        """True if a boolean query parameter is set (?name=1)"""
+        return getattr(self, 'query', {}).get(name, ['0'])[0].lower() in ('1', 'true', 'yes')
+
+    def send_snapshot(self, data, encoder, etag=None):
+        """Send a snapshot whole, or as a keyframe/patch envelope with ?delta=1&since=<version>"""
+        if not self.query_flag('delta'):
+            self.send_json(data, etag=etag)
+            return
+
+        data, extra = encoder.split(data)
+        encoder.update(data)
+        try:
+            since = int(self.query.get('since', [''])[0])
+        except ValueError:
+            since = None
+        self.send_json(encoder.encode(since, extra))
+
+    def send_json(self, data, etag=None):
+        """Send JSON response, compact unless ?pretty=1"""
+        if self.query_flag('pretty'):
+            body = json.dumps(data, indent=2)
+        else:
+            body = json.dumps(data, separators=(',', ':'))
+        self.send_body(body.encode('utf-8'), 'application/json', etag=etag)
+
+    def accepts_gzip(self):
+        """True if the client sent Accept-Encoding with gzip (and not q=0)"""
+        for coding in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = coding.partition(';')
+            if name.strip().lower() in ('gzip', '*'):
+                return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+        return False
+
+    def etag_matches(self, etag):
+        """True if If-None-Match names this ETag (weak comparison of the selected representation)"""
+        header = self.headers.get('If-None-Match')
+        if not header:
+            return False
+        if header.strip() == '*':
+            return True
+        for candidate in header.split(','):
+            candidate = candidate.strip()
+            if candidate.startswith('W/'):
+                candidate = candidate[2:]
+            if candidate == etag:
+                return True
+        return False
+
+    def not_modified(self, etag, last_modified=None):
+        """True if the conditional request headers say the client copy is current"""
+        if self.headers.get('If-None-Match'):
+            return self.etag_matches(etag)
+        since = self.headers.get('If-Modified-Since')
+        if since and last_modified is not None:
+            try:
+                return int(last_modified) <= email.utils.parsedate_to_datetime(since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_not_modified(self, etag, cache_control, last_modified=None, vary=False):
+        """Send a 304 with the validators of the current representation"""
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        if last_modified is not None:
+            self.send_header('Last-Modified', email.utils.formatdate(last_modified, usegmt=True))
+        if vary:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+
+    def send_body(self, body, content_type, etag=None, gzipped=None, cache_control='no-cache',
+                  last_modified=None, compress=None):
+        """Send a response body with Content-Length, ETag revalidation and gzip negotiation
+
+        etag=None derives a validator from the body; etag=False sends none
+        (bodies that change on every request). The gzip representation gets
+        its own "-gzip" ETag so the two codings never validate each other.
+        """
+        if etag is None:
+            etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+        if compress is None:
+            compress = gzipped is not None or len(body) >= GZIP_MIN_BYTES
+        encoding = 'gzip' if compress and self.accepts_gzip() else None
+        if etag and encoding:
+            etag = etag[:-1] + '-gzip"'
+
+        if etag and self.not_modified(etag, last_modified):
+            self.send_not_modified(etag, cache_control, last_modified, vary=compress)
+            return
+
+        if encoding:
+            body = gzipped if gzipped is not None else gzip.compress(body, GZIP_LEVEL)
+
         self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        if last_modified is not None:
+            self.send_header('Last-Modified', email.utils.formatdate(last_modified, usegmt=True))
+        if compress:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
         self.end_headers()
-        self.wfile.write(json.dumps(data, indent=2).encode('utf-8'))
+        if self.command != 'HEAD':
+            self.wfile.write(body)
     
-    def get_magi_html(self):
-        """Generate complete MAGI HTML page"""
+    def get_magi_html(self, assets):
+        """Generate complete MAGI HTML page, linking the pre-rendered CSS/JS assets"""
         return f"""<!DOCTYPE html>
 <html>
 <head>
     <title>MAGI - {CONFIG['node_name']}</title>
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        {self.get_magi_css()}
-    </style>
+    <link rel="stylesheet" href="/static/magi.css?v={assets['/static/magi.css'].version}">
 </head>
 <body>
     <div id="magi-system">
@@ -729,23 +1111,21 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
                 <div class="log-line system">⚡ MAGI_TERMINAL v2.0.0</div>
                 <div class="log-line">
                     <span class="prompt">&gt;</span>
-                    <span>[{time.strftime("%H:%M:%S")}] MAGI System initialized on {CONFIG['node_name']}</span>
+                    <span>[<span class="log-time"></span>] MAGI System initialized on {CONFIG['node_name']}</span>
                 </div>
                 <div class="log-line">
                     <span class="prompt">&gt;</span>
-                    <span>[{time.strftime("%H:%M:%S")}] Enhanced monitoring active</span>
+                    <span>[<span class="log-time"></span>] Enhanced monitoring active</span>
                 </div>
                 <div class="log-line">
                     <span class="prompt">&gt;</span>
-                    <span>[{time.strftime("%H:%M:%S")}] Power management enabled</span>
+                    <span>[<span class="log-time"></span>] Power management enabled</span>
                 </div>
             </div>
         </footer>
     </div>
     
-    <script>
-        {self.get_magi_js()}
-    </script>
+    <script src="/static/magi.js?v={assets['/static/magi.js'].version}"></script>
 </body>
 </html>"""
 
@@ -1424,6 +1804,11 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
             color: #cccccc;
         }
         
+        .service-resources {
+            font-size: 9px;
+            color: #ffaa00;
+        }
+        
         .service-port {
             font-size: 9px;
             color: #00ffff;
@@ -1522,6 +1907,8 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
         // MAGI Enhanced Dashboard JavaScript
         let metricsInterval;
         let nodesInterval;
+        let servicesInterval;
+        let eventSource;
         let terminalCollapsed = false;
         
         function updateTimestamp() {
@@ -1529,19 +1916,53 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
             document.getElementById('timestamp').textContent = now.toLocaleString();
         }
         
+        // Delta-encoded payloads: a keyframe carries the whole snapshot, patches only changed fields
+        const deltaState = {};
+        let metricsVersion = null;
+        
+        function applyPatch(target, patch) {
+            for (const [key, value] of Object.entries(patch)) {
+                const current = target[key];
+                if (value && typeof value === 'object' && !Array.isArray(value) && current && typeof current === 'object') {
+                    applyPatch(current, value);
+                } else {
+                    target[key] = value;
+                }
+            }
+        }
+        
+        function removePaths(target, paths) {
+            for (const path of paths) {
+                let node = target;
+                for (const key of path.slice(0, -1)) {
+                    node = node ? node[key] : undefined;
+                }
+                if (node) delete node[path[path.length - 1]];
+            }
+        }
+        
+        function applyDelta(channel, message) {
+            if (message.type === 'keyframe') {
+                deltaState[channel] = message.data;
+            } else if (deltaState[channel] !== undefined) {
+                removePaths(deltaState[channel], message.removed || []);
+                applyPatch(deltaState[channel], message.patch);
+            }
+            return deltaState[channel];
+        }
+        
         async function fetchMetrics() {
             try {
-                # Use ThreadingTCPServer so SSE and multiple requests won't block each other
-                bind = CONFIG.get('bind_address', '') or ''
-                with socketserver.ThreadingTCPServer((bind, CONFIG["port"]), MAGIHandler) as httpd:
-                    print(f"🚀 MAGI {CONFIG['node_name']} server started (threaded)")
-                    print(f"📡 Access dashboard: http://{bind or 'localhost'}:{CONFIG['port']}")
-                    print(f"🌐 Network access: http://[your-ip]:{CONFIG['port']}")
-                    if CONFIG.get('require_api_key'):
-                        print("🔒 API key enforcement enabled. Use Authorization: Bearer <API_KEY>")
-                    print("Press Ctrl+C to stop")
-                    print("=" * 50)
-                    httpd.serve_forever()
+                const since = metricsVersion === null ? '' : `&since=${metricsVersion}`;
+                const response = await fetch(`/api/all-metrics?delta=1${since}`);
+                const message = await response.json();
+                const allMetrics = applyDelta('poll-metrics', message);
+                if (allMetrics !== undefined) {
+                    metricsVersion = message.version;
+                    updateAllMetrics(allMetrics);
+                }
+            } catch (error) {
+                console.error('Error fetching metrics:', error);
                 addTerminalLog('❌ Error fetching system metrics');
             }
         }
@@ -1717,6 +2138,9 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
                 const portsHtml = service.ports && service.ports.length > 0 ? 
                     service.ports.map(port => `<span class="service-port">:${port}</span>`).join(' ') : '';
                 
+                const resourcesHtml = service.resources ?
+                    `<span class="service-resources">${service.resources.cpu}% CPU · ${service.resources.rss_mb} MB</span>` : '';
+                
                 const processIcon = service.process_detected ? '🟢' : '🔶';
                 const statusText = service.status === 'running' ? 'RUNNING' : 'PORT OPEN';
                 
@@ -1728,6 +2152,7 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
                     <div class="service-details">
                         <span class="service-status ${service.status}">${processIcon} ${statusText}</span>
                         <span class="service-description">${service.description || 'Service'}</span>
+                        ${resourcesHtml}
                         ${portsHtml}
                     </div>
                 `;
@@ -1752,60 +2177,62 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
             try {
                 const response = await fetch('/api/nodes');
                 const nodes = await response.json();
-                
-                const container = document.getElementById('nodes-container');
-                container.innerHTML = '';
-                
-                nodes.forEach(node => {
-                    const nodeCard = document.createElement('div');
-                    let statusClass = node.status;
-                    if (node.self) statusClass = 'current';
-                    
-                    nodeCard.className = `node-card ${statusClass}`;
-                    
-                    let statusText = node.status.toUpperCase();
-                    if (node.self) statusText = 'CURRENT';
-                    
-                    let responseTimeHtml = '';
-                    if (node.response_time >= 0) {
-                        responseTimeHtml = `<div class="node-info">⚡ ${node.response_time}ms</div>`;
-                    }
-                    
-                    let powerStateHtml = '';
-                    if (node.power_state && node.power_state !== 'normal') {
-                        powerStateHtml = `<div class="node-info">🔋 ${node.power_state}</div>`;
-                    }
-                    
-                    // Mostrar servicios principales del nodo
-                    let servicesHtml = '';
-                    if (node.services && Object.keys(node.services).length > 0) {
-                        const serviceCount = Object.keys(node.services).length;
-                        const mainServices = Object.keys(node.services).slice(0, 2).join(', ');
-                        servicesHtml = `<div class="node-info">⚙️ ${serviceCount} services</div>`;
-                        if (mainServices) {
-                            servicesHtml += `<div class="node-info" style="font-size: 9px;">📊 ${mainServices}</div>`;
-                        }
-                    }
-                    
-                    nodeCard.innerHTML = `
-                        <div class="node-status-badge">${statusText}</div>
-                        <div class="node-name">${node.name}</div>
-                        <div class="node-info">${node.ip}:${node.port}</div>
-                        ${responseTimeHtml}
-                        ${powerStateHtml}
-                        ${servicesHtml}
-                        <div class="node-info">Last: ${node.last_seen}</div>
-                    `;
-                    
-                    container.appendChild(nodeCard);
-                });
-                
+                updateNodes(nodes);
             } catch (error) {
                 console.error('Error fetching nodes:', error);
                 addTerminalLog('❌ Error fetching network nodes');
             }
         }
         
+        function updateNodes(nodes) {
+            const container = document.getElementById('nodes-container');
+            container.innerHTML = '';
+            
+            nodes.forEach(node => {
+                const nodeCard = document.createElement('div');
+                let statusClass = node.status;
+                if (node.self) statusClass = 'current';
+                
+                nodeCard.className = `node-card ${statusClass}`;
+                
+                let statusText = node.status.toUpperCase();
+                if (node.self) statusText = 'CURRENT';
+                
+                let responseTimeHtml = '';
+                if (node.response_time >= 0) {
+                    responseTimeHtml = `<div class="node-info">⚡ ${node.response_time}ms</div>`;
+                }
+                
+                let powerStateHtml = '';
+                if (node.power_state && node.power_state !== 'normal') {
+                    powerStateHtml = `<div class="node-info">🔋 ${node.power_state}</div>`;
+                }
+                
+                // Mostrar servicios principales del nodo
+                let servicesHtml = '';
+                if (node.services && Object.keys(node.services).length > 0) {
+                    const serviceCount = Object.keys(node.services).length;
+                    const mainServices = Object.keys(node.services).slice(0, 2).join(', ');
+                    servicesHtml = `<div class="node-info">⚙️ ${serviceCount} services</div>`;
+                    if (mainServices) {
+                        servicesHtml += `<div class="node-info" style="font-size: 9px;">📊 ${mainServices}</div>`;
+                    }
+                }
+                
+                nodeCard.innerHTML = `
+                    <div class="node-status-badge">${statusText}</div>
+                    <div class="node-name">${node.name}</div>
+                    <div class="node-info">${node.ip}:${node.port}</div>
+                    ${responseTimeHtml}
+                    ${powerStateHtml}
+                    ${servicesHtml}
+                    <div class="node-info">Last: ${node.last_seen}</div>
+                `;
+                
+                container.appendChild(nodeCard);
+            });
+        }
+        
         function addTerminalLog(message) {
             const terminal = document.getElementById('terminal');
             const logLine = document.createElement('div');
@@ -1940,48 +2367,65 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
             sshEl.textContent = 'Port 22';
             sshEl.style.color = '#ffff00';
         }
+        function startPolling() {
+            if (metricsInterval) return;
+            fetchMetrics();
+            fetchNodes();
+            fetchAllServices();
+            metricsInterval = setInterval(fetchMetrics, 5000);
+            nodesInterval = setInterval(fetchNodes, 6000);
+            servicesInterval = setInterval(fetchAllServices, 8000);
+        }
+        
+        function stopPolling() {
+            clearInterval(metricsInterval);
+            clearInterval(nodesInterval);
+            clearInterval(servicesInterval);
+            metricsInterval = nodesInterval = servicesInterval = undefined;
+        }
+        
+        function parseStreamEvent(e, channel, update) {
+            try {
+                const data = applyDelta(channel, JSON.parse(e.data));
+                if (data !== undefined) update(data);
+            } catch (err) {
+                console.error('SSE parse error', err);
+            }
+        }
+        
+        function startStream() {
+            // One stream carries metrics, nodes and services; polling is only a fallback
+            eventSource = new EventSource('/api/stream?delta=1');
+            eventSource.onopen = function() {
+                stopPolling();
+                addTerminalLog('📡 Connected to SSE stream for real-time metrics');
+            };
+            eventSource.onmessage = e => parseStreamEvent(e, 'metrics', updateAllMetrics);
+            eventSource.addEventListener('nodes', e => parseStreamEvent(e, 'nodes', updateNodes));
+            eventSource.addEventListener('services', e => parseStreamEvent(e, 'services', updateServices));
+            eventSource.onerror = function() {
+                // EventSource reconnects by itself and resumes from Last-Event-ID; poll meanwhile
+                if (!metricsInterval) {
+                    addTerminalLog('⚠️ SSE connection lost, polling until it reconnects');
+                }
+                startPolling();
+            };
+        }
+        
         function startMonitoring() {
+            // The page is pre-rendered and cached, so startup log lines are stamped here
+            const loadedAt = new Date().toLocaleTimeString();
+            document.querySelectorAll('.log-time').forEach(span => { span.textContent = loadedAt; });
             updateTimestamp();
             checkNetworkInfo();
 
-            // Try Server-Sent Events first
             if (window.EventSource) {
-                try {
-                    const es = new EventSource('/api/stream');
-                    es.onmessage = function(e) {
-                        try {
-                            const data = JSON.parse(e.data);
-                            updateAllMetrics(data);
-                        } catch (err) {
-                            console.error('SSE parse error', err);
-                        }
-                    };
-                    es.onerror = function(ev) {
-                        addTerminalLog('⚠️ SSE connection error, falling back to polling');
-                        try { es.close(); } catch (e) {}
-                        // fallback to polling
-                        fetchMetrics();
-                        metricsInterval = setInterval(fetchMetrics, 5000);
-                    };
-
-                    addTerminalLog('📡 Connected to SSE stream for real-time metrics');
-                } catch (e) {
-                    addTerminalLog('⚠️ SSE not available, using polling');
-                    fetchMetrics();
-                    metricsInterval = setInterval(fetchMetrics, 5000);
-                }
+                startStream();
             } else {
-                // No EventSource support
-                fetchMetrics();
-                metricsInterval = setInterval(fetchMetrics, 5000);
+                addTerminalLog('⚠️ SSE not available, using polling');
+                startPolling();
             }
 
-            // Always keep nodes and services updated
-            fetchNodes();
-            fetchAllServices();
-            nodesInterval = setInterval(fetchNodes, 6000);
-            servicesInterval = setInterval(fetchAllServices, 8000);
-
             // Update timestamp every second
             setInterval(updateTimestamp, 1000);
 
@@ -2002,6 +2446,138 @@ class MAGIHandler(http.server.SimpleHTTPRequestHandler):
         document.addEventListener('DOMContentLoaded', startMonitoring);
         """
 
+class StaticAsset:
+    """Pre-rendered response body with its ETag, gzip variant and cache policy"""
+
+    def __init__(self, body, content_type, cache_control, etag=None, last_modified=None, compress=True):
+        self.body = body
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.last_modified = last_modified
+        digest = hashlib.sha1(body).hexdigest() if etag is None else etag.strip('"')
+        self.etag = f'"{digest[:20]}"' if etag is None else etag
+        self.version = digest[:12]
+        self.gzipped = gzip.compress(body, 9) if compress and len(body) >= GZIP_MIN_BYTES else None
+
+
+IMAGE_CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.svg': 'image/svg+xml'
+}
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+IMAGE_CACHE_CONTROL = 'public, max-age=86400'
+HEALTH_BODIES = {}  # node name -> encoded /api/health body
+
+
+def health_body():
+    """Encoded /api/health body, built once per node name"""
+    name = CONFIG['node_name']
+    body = HEALTH_BODIES.get(name)
+    if body is None:
+        HEALTH_BODIES.clear()
+        body = HEALTH_BODIES[name] = json.dumps({"status": "ok", "node": name}, separators=(',', ':')).encode('utf-8')
+    return body
+
+
+class AssetCache:
+    """Bounded LRU cache of image files, keyed by path and revalidated by mtime/size.
+
+    Files above max_file_bytes are never loaded; get() returns None for them
+    and the caller streams them from disk with sendfile instead.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_file_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.entries = collections.OrderedDict()  # path -> (mtime_ns, size, StaticAsset)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, st):
+        """Return the cached asset for path, (re)loading it if the file changed"""
+        if st.st_size > self.max_file_bytes:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self.entries.move_to_end(path)
+                return entry[2]
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        extension = os.path.splitext(path)[1].lower()
+        asset = StaticAsset(
+            body,
+            IMAGE_CONTENT_TYPES.get(extension, 'application/octet-stream'),
+            IMAGE_CACHE_CONTROL,
+            etag=file_etag(st),
+            last_modified=int(st.st_mtime),
+            # PNG/JPEG are already compressed, SVG is text
+            compress=extension == '.svg'
+        )
+
+        with self.lock:
+            previous = self.entries.pop(path, None)
+            if previous:
+                self.total_bytes -= len(previous[2].body) + len(previous[2].gzipped or b'')
+            self.entries[path] = (st.st_mtime_ns, st.st_size, asset)
+            self.total_bytes += len(asset.body) + len(asset.gzipped or b'')
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted.body) + len(evicted.gzipped or b'')
+        return asset
+
+
+def file_etag(st):
+    """Cheap validator for a file from its mtime and size"""
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+IMAGE_CACHE = AssetCache()
+
+
+# CSS/JS URLs carry a content hash (?v=), so browsers may cache them forever
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+# Pages are behind login, so they are revalidated through their ETag instead
+PAGE_CACHE = 'no-cache, private'
+
+STATIC_ASSETS = {}
+STATIC_ASSETS_LOCK = threading.Lock()
+
+
+def render_static_assets():
+    """Render the dashboard, login page and their CSS/JS once into byte buffers"""
+    assets = {
+        '/static/magi.css': StaticAsset(MAGIHandler.get_magi_css(None).encode('utf-8'),
+                                        'text/css; charset=utf-8', IMMUTABLE_CACHE),
+        '/static/magi.js': StaticAsset(MAGIHandler.get_magi_js(None).encode('utf-8'),
+                                       'application/javascript; charset=utf-8', IMMUTABLE_CACHE),
+        '/static/login.css': StaticAsset(MAGIHandler.get_login_css(None).encode('utf-8'),
+                                         'text/css; charset=utf-8', IMMUTABLE_CACHE)
+    }
+    assets['/'] = StaticAsset(MAGIHandler.get_magi_html(None, assets).encode('utf-8'),
+                              'text/html; charset=utf-8', PAGE_CACHE)
+    assets['/login'] = StaticAsset(MAGIHandler.render_login_page(None, assets).encode('utf-8'),
+                                   'text/html; charset=utf-8', PAGE_CACHE)
+    return assets
+
+
+def get_static_assets():
+    """Return all pre-rendered assets, rendering them on first use"""
+    with STATIC_ASSETS_LOCK:
+        if not STATIC_ASSETS:
+            STATIC_ASSETS.update(render_static_assets())
+        return STATIC_ASSETS
+
+
+def get_static_asset(path):
+    """Return one pre-rendered asset, or None"""
+    return get_static_assets().get(path)
+
+
 def change_power_mode(mode):
     """Change system power mode"""
     try:
@@ -2115,33 +2691,421 @@ def system_sleep():
             "message": f"Error putting system to sleep: {e}"
         }
 
+class MetricsSampler:
+    """Collect system metrics on a fixed cadence into an in-memory snapshot"""
+
+    def __init__(self):
+        self.interval = CONFIG.get('sample_interval', 2)
+        self.snapshot = None
+        self.sampled_at = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Take a first sample and start the background sampling thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.interval = CONFIG.get('sample_interval', 2)
+        # Blocking first sample primes psutil's CPU counters for later non-blocking reads
+        self.sample(cpu_interval=0.5)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='magi-sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the sampling thread"""
+        self.stop_event.set()
+
+    def run(self):
+        """Sampling loop, keeps a fixed cadence regardless of collection time"""
+        next_sample = time.monotonic() + self.interval
+        while not self.stop_event.wait(max(0, next_sample - time.monotonic())):
+            self.sample()
+            next_sample += self.interval
+            # Skip missed ticks instead of bursting after a slow collection
+            if next_sample < time.monotonic():
+                next_sample = time.monotonic() + self.interval
+
+    def sample(self, cpu_interval=None):
+        """Collect one sample and publish it as the current snapshot"""
+        try:
+            metrics = collect_system_metrics(cpu_interval)
+        except Exception as e:
+            print(f"Error sampling metrics: {e}")
+            metrics = get_system_metrics_fallback()
+        sampled_at = time.time()
+        with self.lock:
+            self.snapshot = metrics
+            self.sampled_at = sampled_at
+        METRIC_HISTORY.record(metrics, sampled_at)
+
+    def get(self):
+        """Return a copy of the latest snapshot with its age, or None before the first sample"""
+        with self.lock:
+            snapshot = self.snapshot
+            sampled_at = self.sampled_at
+        if snapshot is None:
+            return None
+        metrics = dict(snapshot)
+        metrics['sampled_at'] = round(sampled_at, 3)
+        metrics['sample_age'] = round(max(0, time.time() - sampled_at), 3)
+        return metrics
+
+
+METRICS_SAMPLER = MetricsSampler()
+
+
 def get_system_metrics():
-    """Get enhanced system metrics including network, temperature, power state and services"""
-    try:
-        # CPU usage (average over 1 second)
-        cpu_usage = int(psutil.cpu_percent(interval=1))
+    """Get the latest system metrics from the background sampler without blocking"""
+    metrics = METRICS_SAMPLER.get()
+    if metrics is None:
+        # Sampler not running (e.g. module used directly), collect synchronously
+        metrics = collect_system_metrics(cpu_interval=1)
+        metrics['sample_age'] = 0
+    return metrics
+
+
+class ProcReader:
+    """Linux fast path for the core host counters, with psutil as the fallback.
+
+    /proc/stat, /proc/meminfo, /proc/net/dev and the hwmon and cpufreq
+    files are opened once and re-read with os.preadv into reusable
+    buffers, which are parsed in place under the reader lock; only the
+    fields the snapshot emits are extracted. Sensor names,
+    labels and thresholds are read once at discovery. Every method returns
+    None when the fast path cannot answer, and callers then use psutil.
+    """
+
+    BUFFER_SIZE = 16384
+    HWMON_ROOT = '/sys/class/hwmon'
+    CPUFREQ_ROOT = '/sys/devices/system/cpu/cpufreq'
+    MEMINFO_FIELDS = (b'MemTotal:', b'MemFree:', b'MemAvailable:', b'\nBuffers:', b'\nCached:')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fds = {}
+        self.buffers = {}
+        self.boot = None
+        self.no_pressure = set()
+        self.sensors = None
+        self.frequencies = None
+
+    def available(self):
+        """True on Linux with /proc mounted and the fast path enabled"""
+        return (CONFIG.get('proc_fast_path', True) and sys.platform.startswith('linux')
+                and hasattr(os, 'pread') and os.path.exists('/proc/stat'))
+
+    def read(self, path, parse):
+        """parse(buffer, size) over the current contents of a /proc or /sys file.
+
+        The file is re-read through its cached descriptor into its reusable
+        buffer; parse runs under the lock because the buffer is shared.
+        """
+        with self.lock:
+            fd = self.fds.get(path)
+            if fd is None:
+                fd = self.fds[path] = os.open(path, os.O_RDONLY)
+                self.buffers[path] = bytearray(self.BUFFER_SIZE)
+            buffer = self.buffers[path]
+            while True:
+                if hasattr(os, 'preadv'):
+                    size = os.preadv(fd, [buffer], 0)
+                else:
+                    data = os.pread(fd, len(buffer), 0)
+                    size = len(data)
+                    buffer[:size] = data
+                if size < len(buffer):
+                    return parse(buffer, size)
+                # Larger than the buffer (e.g. /proc/stat on big machines): grow and re-read
+                buffer = self.buffers[path] = bytearray(len(buffer) * 2)
+
+    def value(self, path):
+        """Integer contents of a single-value sysfs file, or None"""
+        try:
+            return self.read(path, lambda data, size: int(data[:size]))
+        except (OSError, ValueError):
+            return None
+
+    def cpu_times(self):
+        """(aggregate, [per core]) jiffy lists from /proc/stat in CpuStats.FIELDS order; caches btime"""
+        return self.read('/proc/stat', self.parse_stat)
+
+    def parse_stat(self, data, size):
+        """Parse the cpu lines (and btime once) of /proc/stat in place"""
+        aggregate, cores = None, []
+        position = 0
+        # The cpu lines come first; stop there rather than splitting the long intr line
+        while data.startswith(b'cpu', position, size):
+            end = data.index(b'\n', position, size)
+            # user nice system idle iowait irq softirq steal; guest time is already in user/nice
+            fields = data[position:end].split()
+            position = end + 1
+            values = [int(field) for field in fields[1:9]]
+            if fields[0] == b'cpu':
+                aggregate = values
+            else:
+                cores.append(values)
+        if self.boot is None:
+            start = data.index(b'\nbtime ', position, size) + 7
+            self.boot = float(data[start:data.index(b'\n', start, size)])
+        return aggregate, cores
+
+    def boot_time(self):
+        """Boot time in epoch seconds from /proc/stat btime"""
+        if self.boot is None:
+            try:
+                self.cpu_times()
+            except (OSError, ValueError):
+                return None
+        return self.boot
+
+    def pressure(self):
+        """Pressure stall averages per resource from /proc/pressure (empty without PSI); not gated by proc_fast_path"""
+        pressure = {}
+        for resource in ('cpu', 'memory', 'io'):
+            if resource in self.no_pressure:
+                continue
+            try:
+                pressure[resource] = self.read('/proc/pressure/' + resource, self.parse_pressure)
+            except OSError:
+                # Kernel without PSI, or booted with psi=0 (the read fails with EOPNOTSUPP)
+                self.no_pressure.add(resource)
+            except ValueError:
+                # Unexpected line layout: drop this resource for this sample, keep the rest
+                continue
+        return pressure
+
+    def parse_pressure(self, data, size):
+        """Parse one /proc/pressure file in place"""
+        stalls = {}
+        # some avg10=2.04 avg60=1.40 avg300=1.05 total=47833342
+        for line in data[:size].split(b'\n'):
+            fields = line.split()
+            if fields:
+                stalls[fields[0].decode()] = {
+                    key.decode(): float(value) for key, _, value in (field.partition(b'=') for field in fields[1:4])
+                }
+        return stalls
+
+    def virtual_memory(self):
+        """Memory totals from /proc/meminfo, computed the way psutil does"""
+        try:
+            fields = self.read('/proc/meminfo', self.parse_meminfo)
+            total = fields[b'MemTotal:']
+            free = fields[b'MemFree:']
+        except (OSError, ValueError, KeyError):
+            return None
+        if b'MemAvailable:' in fields:
+            available = fields[b'MemAvailable:']
+        else:
+            # Kernels before 3.14
+            available = free + fields.get(b'\nBuffers:', 0) + fields.get(b'\nCached:', 0)
+        # psutil reports used as total - available
+        used = total - available
+        percent = round(used / total * 100, 1) if total else 0.0
+        return HostMemory(total, available, percent, used, free)
+
+    def parse_meminfo(self, data, size):
+        """Byte values of MEMINFO_FIELDS from /proc/meminfo, parsed in place"""
+        fields = {}
+        for name in self.MEMINFO_FIELDS:
+            # Look the few fields we need up directly instead of splitting ~50 lines
+            start = data.find(name, 0, size)
+            if start != -1:
+                start += len(name)
+                fields[name] = int(data[start:data.index(b'kB', start, size)]) * 1024
+        return fields
+
+    def net_counters(self):
+        """Per-interface counters from /proc/net/dev, keyed like psutil.net_io_counters(pernic=True)"""
+        try:
+            return self.read('/proc/net/dev', self.parse_net_dev)
+        except (OSError, ValueError):
+            return None
+
+    def parse_net_dev(self, data, size):
+        """Parse /proc/net/dev in place, one interface line at a time"""
+        counters = {}
+        # Skip the two header lines
+        position = data.index(b'\n', data.index(b'\n', 0, size) + 1, size) + 1
+        while position < size:
+            end = data.find(b'\n', position, size)
+            if end == -1:
+                end = size
+            colon = data.find(b':', position, end)
+            fields = data[colon + 1:end].split() if colon != -1 else ()
+            if len(fields) >= 12:
+                counters[data[position:colon].strip().decode('ascii', 'replace')] = {
+                    'bytes_sent': int(fields[8]),
+                    'bytes_recv': int(fields[0]),
+                    'packets_sent': int(fields[9]),
+                    'packets_recv': int(fields[1]),
+                    'errin': int(fields[2]),
+                    'errout': int(fields[10]),
+                    'dropin': int(fields[3]),
+                    'dropout': int(fields[11])
+                }
+            position = end + 1
+        return counters
+
+    def discover_sensors(self):
+        """(key, input path, high, critical) for every hwmon temperature input"""
+        sensors = []
+        root = self.HWMON_ROOT
+        try:
+            hwmons = sorted(os.listdir(root))
+        except OSError:
+            return sensors
+        for hwmon in hwmons:
+            directory = os.path.join(root, hwmon)
+            try:
+                with open(os.path.join(directory, 'name')) as f:
+                    name = f.read().strip()
+                inputs = sorted(entry for entry in os.listdir(directory)
+                                if entry.startswith('temp') and entry.endswith('_input'))
+            except OSError:
+                continue
+            for entry in inputs:
+                prefix = os.path.join(directory, entry[:-len('_input')])
+                try:
+                    with open(prefix + '_label') as f:
+                        label = f.read().strip()
+                except OSError:
+                    label = ''
+                high = self.value(prefix + '_max')
+                critical = self.value(prefix + '_crit')
+                high = high / 1000.0 if high is not None else None
+                critical = critical / 1000.0 if critical is not None else None
+                # psutil fills a missing threshold from the other one
+                high, critical = high or critical, critical or high
+                key = f"{name}_{label}" if label else name
+                sensors.append((key, prefix + '_input', high, critical))
+        return sensors
+
+    def temperatures(self):
+        """{sensor: {current, high, critical}} from hwmon, or None when there are no hwmon sensors"""
+        if self.sensors is None:
+            self.sensors = self.discover_sensors()
+        if not self.sensors:
+            return None
+        temperatures = {}
+        for key, path, high, critical in self.sensors:
+            current = self.value(path)
+            if current is not None:
+                temperatures[key] = {"current": current / 1000.0, "high": high, "critical": critical}
+        return temperatures
+
+    def cpu_freq(self):
+        """(current, max) MHz averaged over cpufreq policies, or None without cpufreq"""
+        if self.frequencies is None:
+            policies = []
+            root = self.CPUFREQ_ROOT
+            try:
+                for policy in sorted(os.listdir(root)):
+                    if policy.startswith('policy'):
+                        maximum = self.value(os.path.join(root, policy, 'scaling_max_freq'))
+                        policies.append((os.path.join(root, policy, 'scaling_cur_freq'), maximum or 0))
+            except OSError:
+                pass
+            self.frequencies = policies
+        readings = [(self.value(path), maximum) for path, maximum in self.frequencies]
+        readings = [(current, maximum) for current, maximum in readings if current is not None]
+        if not readings:
+            return None
+        return (sum(current for current, _ in readings) / len(readings) / 1000.0,
+                sum(maximum for _, maximum in readings) / len(readings) / 1000.0)
+
+
+HostMemory = collections.namedtuple('HostMemory', 'total available percent used free')
+
+
+class CpuStats:
+    """Busy percent, per-state breakdown and per-core usage from successive CPU time readings.
+
+    Readings come from the /proc fast path when it is available and from
+    psutil.cpu_times otherwise; only the ratios between deltas are used,
+    so jiffies and seconds work the same.
+    """
+
+    FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+
+    def __init__(self):
+        self.previous = None
+
+    def times(self):
+        """(aggregate, [per core]) lists of CPU times in FIELDS order"""
+        if PROC_READER.available():
+            try:
+                return PROC_READER.cpu_times()
+            except (OSError, ValueError):
+                pass
+        return ([getattr(psutil.cpu_times(), name, 0.0) for name in self.FIELDS],
+                [[getattr(core, name, 0.0) for name in self.FIELDS] for core in psutil.cpu_times(percpu=True)])
+
+    def usage(self, old, new):
+        """{percent, user, nice, ...} between two readings of one CPU line"""
+        deltas = [max(0, after - before) for before, after in zip(old, new)]
+        total = sum(deltas)
+        if not total:
+            return dict.fromkeys(('percent',) + self.FIELDS, 0.0)
+        stats = {name: round(delta / total * 100, 1) for name, delta in zip(self.FIELDS, deltas)}
+        stats['percent'] = round((total - deltas[3] - deltas[4]) / total * 100, 1)
+        return stats
+
+    def sample(self, interval=None):
+        """Usage since the previous call, or over interval seconds, plus a 'cores' list of busy percents"""
+        if interval:
+            previous = self.times()
+            time.sleep(interval)
+        else:
+            previous = self.previous
+        current = self.times()
+        self.previous = current
+        if previous is None:
+            # First reading: nothing to compare against yet (same as psutil.cpu_percent)
+            previous = current
+        stats = self.usage(previous[0], current[0])
+        stats['cores'] = [self.usage(old, new)['percent'] for old, new in zip(previous[1], current[1])]
+        return stats
+
+
+CPU_STATS = CpuStats()
+
+PROC_READER = ProcReader()
+
+
+def collect_system_metrics(cpu_interval=None):
+    """Get enhanced system metrics including network, temperature, power state and services"""
+    try:
+        # Core host counters come from /proc directly on Linux; psutil covers everything else
+        fast = PROC_READER.available()
+
+        # CPU usage since the previous sample (or averaged over cpu_interval seconds)
+        cpu_stats = CPU_STATS.sample(cpu_interval)
+        cpu_usage = int(cpu_stats.pop('percent'))
+        load_avg = os.getloadavg() if hasattr(os, 'getloadavg') else None
         
         # Memory usage
-        memory = psutil.virtual_memory()
+        memory = PROC_READER.virtual_memory() if fast else None
+        if memory is None:
+            memory = psutil.virtual_memory()
         memory_percentage = int(memory.percent)
         
         # Disk usage
         disk = psutil.disk_usage('/')
-        disk_percentage = int((disk.used / disk.total) * 100)
+        # psutil's percent (used / (used + free)) counts reserved blocks as unavailable, like df and the per-mount entries
+        disk_percentage = int(disk.percent)
+        now = time.monotonic()
         
-        # Network stats
-        net_io = psutil.net_io_counters()
-        network_usage = {
-            "bytes_sent": net_io.bytes_sent,
-            "bytes_recv": net_io.bytes_recv,
-            "mb_sent": round(net_io.bytes_sent / (1024*1024), 2),
-            "mb_recv": round(net_io.bytes_recv / (1024*1024), 2)
-        }
+        # Network totals and rates since the previous sample
+        network_usage = collect_network_metrics(PROC_READER.net_counters() if fast else None)
         
         # Temperature monitoring
-        temperatures = {}
+        temperatures = PROC_READER.temperatures() if fast else None
         try:
-            if hasattr(psutil, 'sensors_temperatures'):
+            if temperatures is None and hasattr(psutil, 'sensors_temperatures'):
+                temperatures = {}
                 temps = psutil.sensors_temperatures()
                 for name, entries in temps.items():
                     for entry in entries:
@@ -2153,31 +3117,92 @@ def get_system_metrics():
                         }
         except:
             # Fallback temperature
-            temperatures["cpu"] = {"current": 45, "high": 75, "critical": 85}
+            temperatures = {"cpu": {"current": 45, "high": 75, "critical": 85}}
+        if temperatures is None:
+            temperatures = {}
         
         # Power management state detection
         power_state = "normal"
         try:
-            cpu_freq = psutil.cpu_freq()
-            if cpu_freq and cpu_freq.current < cpu_freq.max * 0.7:
+            cpu_freq = PROC_READER.cpu_freq() if fast else None
+            if cpu_freq is None:
+                cpu_freq = psutil.cpu_freq()
+                cpu_freq = (cpu_freq.current, cpu_freq.max) if cpu_freq else None
+            if cpu_freq and cpu_freq[0] < cpu_freq[1] * 0.7:
                 power_state = "power_save"
             
-            load_avg = os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0
-            if load_avg < 0.5:
+            if (load_avg[0] if load_avg else 0) < 0.5:
                 power_state = "low_power"
         except:
             pass
         
         # Detect running services
         services = detect_services()
+
+        # cgroup v2 accounting per systemd unit and container scope
+        cgroups = CGROUP_MONITOR.collect(now)
+        unit_usage = CGROUP_MONITOR.service_usage(cgroups)
+
+        # Processes inside a unit accounted from its cgroup are not read one by one;
+        # matched processes anywhere else (other units, sessions, containers) still are
+        unit_services = {}
+        for service_name, usage in unit_usage.items():
+            for unit_name in usage["units"]:
+                unit_services.setdefault(unit_name, set()).add(service_name)
+        matched = SERVICE_DETECTOR.matched_processes()
+        if unit_services:
+            pid_units = CGROUP_MONITOR.units_of(matched)
+            for pid, (create_time, service_names) in list(matched.items()):
+                remaining = service_names - unit_services.get(pid_units[pid], set())
+                if remaining:
+                    matched[pid] = (create_time, remaining)
+                else:
+                    del matched[pid]
+        service_usage = PROCESS_TABLE.service_usage(now, matched)
+        for service_name, usage in unit_usage.items():
+            resources = {
+                "source": "cgroup",
+                "processes": usage["pids"],
+                "cpu": usage["cpu"],
+                # Memory charged to the unit (memory.current), which includes its page cache
+                "rss_mb": usage["memory_mb"],
+                "open_files": None,
+                "io_bytes_s": round(usage["io_read_bytes_s"] + usage["io_write_bytes_s"], 1)
+            }
+            outside = service_usage.get(service_name)
+            if outside:
+                # Matched processes outside the service's units add to the unit totals
+                resources.update({
+                    "source": "cgroup+process",
+                    "processes": (usage["pids"] or 0) + outside["processes"],
+                    "cpu": round(usage["cpu"] + outside["cpu"], 1),
+                    "rss_mb": round(usage["memory_mb"] + outside["rss_mb"], 1),
+                    "io_bytes_s": round(resources["io_bytes_s"] + outside["io_bytes_s"], 1)
+                })
+            service_usage[service_name] = resources
+        for service_name, usage in service_usage.items():
+            if service_name in services:
+                # Copy: the detector reuses its services map between ticks
+                services[service_name] = dict(services[service_name], resources=usage)
+                if service_name in unit_usage:
+                    services[service_name]["cgroup"] = unit_usage[service_name]
+
+        # The full process table feeds /api/processes on its own interval
+        PROCESS_TABLE.refresh(now, memory.total)
         
         # Boot time / uptime
-        boot_time = psutil.boot_time()
+        boot_time = PROC_READER.boot_time() if fast else None
+        if boot_time is None:
+            boot_time = psutil.boot_time()
         uptime_seconds = time.time() - boot_time
         uptime_hours = int(uptime_seconds / 3600)
         
         return {
             "cpu": cpu_usage,
+            "cpu_detail": cpu_stats,
+            "load": {"1m": round(load_avg[0], 2), "5m": round(load_avg[1], 2), "15m": round(load_avg[2], 2)} if load_avg else {},
+            # PSI has no psutil equivalent, so it is read whether or not the fast path is on
+            "pressure": PROC_READER.pressure() if sys.platform.startswith('linux') else {},
             "memory": {
                 "percentage": memory_percentage,
                 "used_gb": round(memory.used / (1024**3), 2),
@@ -2186,12 +3211,15 @@ def get_system_metrics():
             "disk": {
                 "percentage": disk_percentage,
                 "used_gb": round(disk.used / (1024**3), 2),
-                "total_gb": round(disk.total / (1024**3), 2)
+                "total_gb": round(disk.total / (1024**3), 2),
+                "mounts": DISK_MONITOR.mount_usage(now),
+                "devices": DISK_MONITOR.device_rates(now)
             },
             "network": network_usage,
             "temperature": temperatures,
             "power_state": power_state,
             "services": services,
+            "cgroups": cgroups,
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             "node_status": "online"
         }
@@ -2199,39 +3227,1019 @@ def get_system_metrics():
         print(f"Error getting metrics: {e}")
         return get_system_metrics_fallback()
 
-def detect_services():
-    """Detect comprehensive services running on the system"""
-    services = {}
 
-    # Common services with typical process names and ports
-    service_definitions = {
-        "nextcloud": {"processes": ["nginx", "apache2", "nextcloud", "php-fpm"], "ports": [80, 443, 8080], "description": "Cloud Storage"},
-        "jellyfin": {"processes": ["jellyfin"], "ports": [8096, 8920], "description": "Media Server"},
-        "plex": {"processes": ["plexmediaserver", "plex"], "ports": [32400], "description": "Media Server"},
-        "emby": {"processes": ["emby", "embyserver"], "ports": [8096], "description": "Media Server"},
-        "docker": {"processes": ["docker", "dockerd", "containerd"], "ports": [2375, 2376], "description": "Container Platform"},
-        "ssh": {"processes": ["sshd", "ssh"], "ports": [22], "description": "Remote Access"},
-        "web": {"processes": ["nginx", "apache2", "httpd", "lighttpd"], "ports": [80, 443, 8080, 8443], "description": "Web Server"},
-        "database": {"processes": ["mysql", "mysqld", "postgresql", "postgres", "mariadb"], "ports": [3306, 5432], "description": "Database"},
-        "samba": {"processes": ["smbd", "nmbd"], "ports": [139, 445], "description": "File Sharing"},
-        "transmission": {"processes": ["transmission-daemon", "transmission"], "ports": [9091], "description": "Torrent Client"},
-        "pihole": {"processes": ["pihole", "dnsmasq", "lighttpd"], "ports": [53, 80], "description": "DNS Filter"},
-        "homeassistant": {"processes": ["homeassistant", "hass"], "ports": [8123], "description": "Home Automation"},
-        "mqtt": {"processes": ["mosquitto", "mqtt"], "ports": [1883, 8883], "description": "IoT Messaging"},
-        "vnc": {"processes": ["vncserver", "vnc", "x11vnc"], "ports": [5900, 5901], "description": "Remote Desktop"},
-        "magi": {"processes": ["magi-node", "python3"], "ports": [8080, 8081, 8082], "description": "MAGI Monitor"}
+class CounterRates:
+    """Per-second rates from successive readings of cumulative counters.
+
+    A counter that goes backwards either wrapped at 32 bits (it was in the
+    upper half of that range) or was reset, e.g. by a re-created interface;
+    a reset counts from zero instead of producing a huge bogus spike.
+    """
+
+    WRAP = 2 ** 32
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = {}
+
+    def update(self, key, counters, now):
+        """Return {name: rate per second} since the previous reading for key (zeros the first time)"""
+        with self.lock:
+            previous = self.previous.get(key)
+            self.previous[key] = (now, counters)
+        if previous is None or now <= previous[0]:
+            return {name: 0.0 for name in counters}
+
+        elapsed = now - previous[0]
+        rates = {}
+        for name, value in counters.items():
+            old = previous[1].get(name, value)
+            delta = value - old
+            if delta < 0:
+                wrapped = self.WRAP // 2 <= old < self.WRAP and value < self.WRAP
+                delta = value + self.WRAP - old if wrapped else value
+            rates[name] = delta / elapsed
+        return rates
+
+    def retain(self, keys):
+        """Forget keys that disappeared (removed interfaces or disks)"""
+        with self.lock:
+            for key in set(self.previous) - set(keys):
+                del self.previous[key]
+
+
+NETWORK_RATES = CounterRates()
+
+
+def collect_network_metrics(per_nic=None):
+    """Cumulative network totals plus per-interface throughput, packet, error and drop rates
+
+    per_nic maps interface names to counter dicts (the /proc fast path);
+    without it the counters come from psutil.
+    """
+    now = time.monotonic()
+    if per_nic is None:
+        per_nic = {name: io._asdict() for name, io in psutil.net_io_counters(pernic=True).items()}
+    exclude = tuple(CONFIG.get('network_exclude', ()))
+    if exclude:
+        # Cumulative totals and rates cover the same interfaces
+        per_nic = {name: io for name, io in per_nic.items() if not name.startswith(exclude)}
+
+    bytes_sent = sum(io['bytes_sent'] for io in per_nic.values())
+    bytes_recv = sum(io['bytes_recv'] for io in per_nic.values())
+    totals = collections.Counter()
+    interfaces = {}
+    for name, io in per_nic.items():
+        rates = NETWORK_RATES.update(name, io, now)
+        totals.update(rates)
+        interfaces[name] = {
+            "tx_bytes_s": round(rates['bytes_sent'], 1),
+            "rx_bytes_s": round(rates['bytes_recv'], 1),
+            "tx_packets_s": round(rates['packets_sent'], 1),
+            "rx_packets_s": round(rates['packets_recv'], 1),
+            "tx_errors_s": round(rates['errout'], 2),
+            "rx_errors_s": round(rates['errin'], 2),
+            "tx_drops_s": round(rates['dropout'], 2),
+            "rx_drops_s": round(rates['dropin'], 2)
+        }
+    NETWORK_RATES.retain(interfaces)
+
+    return {
+        "bytes_sent": bytes_sent,
+        "bytes_recv": bytes_recv,
+        "mb_sent": round(bytes_sent / (1024*1024), 2),
+        "mb_recv": round(bytes_recv / (1024*1024), 2),
+        "upload_mb_s": round(totals['bytes_sent'] / (1024*1024), 3),
+        "download_mb_s": round(totals['bytes_recv'] / (1024*1024), 3),
+        "packets_s": round(totals['packets_sent'] + totals['packets_recv'], 1),
+        "errors_s": round(totals['errin'] + totals['errout'], 2),
+        "drops_s": round(totals['dropin'] + totals['dropout'], 2),
+        "interfaces": interfaces
     }
 
-    try:
-        running_processes = []
-        for p in psutil.process_iter(['name', 'cmdline']):
+
+class DiskMonitor:
+    """Per-mount usage and per-device I/O rates for the sampler.
+
+    Mounts are listed and statvfs'd every mount_scan_interval seconds, since
+    usage moves slowly and a stuck mount must not stall every tick; device
+    counters are read every tick and turned into rates. disk_include and
+    disk_exclude (fnmatch patterns on mountpoints and device names) and
+    disk_max_entries keep the payload bounded.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mounts = {}
+        self.scanned_at = None
+        self.rates = CounterRates()
+        self.partitions = {}
+
+    def selected(self, *names):
+        """True if any name matches disk_include (or it is empty) and none matches disk_exclude"""
+        include = CONFIG.get('disk_include') or ['*']
+        exclude = CONFIG.get('disk_exclude', [])
+        if any(fnmatch.fnmatch(name, pattern) for name in names for pattern in exclude):
+            return False
+        return any(fnmatch.fnmatch(name, pattern) for name in names for pattern in include)
+
+    def mount_usage(self, now):
+        """Usage for every selected real filesystem, refreshed every mount_scan_interval"""
+        with self.lock:
+            if self.scanned_at is not None and now - self.scanned_at < CONFIG.get('mount_scan_interval', 30):
+                return self.mounts
+            self.scanned_at = now
+
+        skip_fstypes = set(CONFIG.get('disk_exclude_fstypes', []))
+        mounts = {}
+        seen_devices = set()
+        for part in psutil.disk_partitions(all=False):
+            if len(mounts) >= CONFIG.get('disk_max_entries', 32):
+                break
+            device = os.path.basename(part.device)
+            if part.fstype in skip_fstypes or not self.selected(part.mountpoint, device):
+                continue
+            # Bind mounts of the same device would only repeat its usage
+            if part.device in seen_devices:
+                continue
             try:
-                name = (p.info.get('name') or '').lower()
-                cmdline = ' '.join(p.info.get('cmdline') or []).lower()
-                running_processes.append((name, cmdline))
-            except Exception:
+                usage = psutil.disk_usage(part.mountpoint)
+            except OSError:
                 continue
+            seen_devices.add(part.device)
+            mounts[part.mountpoint] = {
+                "device": part.device,
+                "fstype": part.fstype,
+                "percentage": round(usage.percent, 1),
+                "used_gb": round(usage.used / (1024**3), 2),
+                "total_gb": round(usage.total / (1024**3), 2)
+            }
+
+        with self.lock:
+            self.mounts = mounts
+        return mounts
+
+    def is_partition(self, device):
+        """True for partitions of a whole disk, whose I/O the disk already counts (Linux)"""
+        if device not in self.partitions:
+            self.partitions[device] = os.path.exists(f'/sys/class/block/{device}/partition')
+        return self.partitions[device]
+
+    def device_rates(self, now):
+        """Read/write throughput, IOPS and busy% per selected whole device since the previous tick"""
+        try:
+            counters = psutil.disk_io_counters(perdisk=True) or {}
+        except Exception:
+            return {}
+
+        devices = {}
+        for name, io in sorted(counters.items()):
+            if len(devices) >= CONFIG.get('disk_max_entries', 32):
+                break
+            if self.is_partition(name) or not self.selected(name):
+                continue
+            readings = {
+                'read_bytes': io.read_bytes, 'write_bytes': io.write_bytes,
+                'read_count': io.read_count, 'write_count': io.write_count
+            }
+            busy_time = getattr(io, 'busy_time', None)
+            if busy_time is not None:
+                readings['busy_time'] = busy_time
+            rates = self.rates.update(name, readings, now)
+            devices[name] = {
+                "read_bytes_s": round(rates['read_bytes'], 1),
+                "write_bytes_s": round(rates['write_bytes'], 1),
+                "read_iops": round(rates['read_count'], 1),
+                "write_iops": round(rates['write_count'], 1),
+                # busy_time is in milliseconds
+                "busy_percent": round(min(100.0, rates['busy_time'] / 10), 1) if busy_time is not None else None
+            }
+        self.rates.retain(devices)
+        return devices
+
+
+DISK_MONITOR = DiskMonitor()
+
+
+def simulated_network_metrics(upload_mb_s, download_mb_s):
+    """Simulated network section shaped like collect_network_metrics()"""
+    mb = 1024 * 1024
+    return {
+        "bytes_sent": int(upload_mb_s * mb * 3600),
+        "bytes_recv": int(download_mb_s * mb * 3600),
+        "mb_sent": round(upload_mb_s * 3600, 2),
+        "mb_recv": round(download_mb_s * 3600, 2),
+        "upload_mb_s": round(upload_mb_s, 3),
+        "download_mb_s": round(download_mb_s, 3),
+        "packets_s": round((upload_mb_s + download_mb_s) * mb / 1400, 1),
+        "errors_s": 0.0,
+        "drops_s": 0.0,
+        "interfaces": {
+            "eth0": {
+                "tx_bytes_s": round(upload_mb_s * mb, 1),
+                "rx_bytes_s": round(download_mb_s * mb, 1),
+                "tx_packets_s": round(upload_mb_s * mb / 1400, 1),
+                "rx_packets_s": round(download_mb_s * mb / 1400, 1),
+                "tx_errors_s": 0.0,
+                "rx_errors_s": 0.0,
+                "tx_drops_s": 0.0,
+                "rx_drops_s": 0.0
+            }
+        }
+    }
+
+
+# History tiers: (name, resolution in seconds, retention in seconds); raw follows sample_interval
+HISTORY_TIERS = (
+    ('raw', None, 3600),
+    ('1m', 60, 86400),
+    ('15m', 900, 30 * 86400),
+)
+
+# Time span of one on-disk segment file per tier
+HISTORY_SEGMENT_SECONDS = {'raw': 600, '1m': 6 * 3600, '15m': 5 * 86400}
+
+
+def history_points(metrics):
+    """Flatten a metrics snapshot into (name, value, kind) history points.
+
+    Gauges are averaged when downsampled; counters keep the last value.
+    """
+    points = [
+        ('cpu', metrics.get('cpu'), 'gauge'),
+    ]
+    for state in ('user', 'system', 'iowait', 'steal'):
+        points.append((f'cpu.{state}', metrics.get('cpu_detail', {}).get(state), 'gauge'))
+    for window, value in metrics.get('load', {}).items():
+        points.append((f'load.{window}', value, 'gauge'))
+    for resource, stalls in sorted(metrics.get('pressure', {}).items()):
+        for kind, averages in sorted(stalls.items()):
+            # avg10 is closest to the sampler cadence; longer windows come from downsampling
+            points.append((f'pressure.{resource}.{kind}', averages.get('avg10'), 'gauge'))
+    points += [
+        ('memory.percentage', metrics.get('memory', {}).get('percentage'), 'gauge'),
+        ('memory.used_gb', metrics.get('memory', {}).get('used_gb'), 'gauge'),
+        ('disk.percentage', metrics.get('disk', {}).get('percentage'), 'gauge'),
+        ('disk.used_gb', metrics.get('disk', {}).get('used_gb'), 'gauge'),
+    ]
+    for mountpoint, usage in sorted(metrics.get('disk', {}).get('mounts', {}).items()):
+        points.append((f'disk.mount.{mountpoint}.percentage', usage.get('percentage'), 'gauge'))
+    for name, rates in sorted(metrics.get('disk', {}).get('devices', {}).items()):
+        points.append((f'disk.io.{name}.read_bytes_s', rates.get('read_bytes_s'), 'gauge'))
+        points.append((f'disk.io.{name}.write_bytes_s', rates.get('write_bytes_s'), 'gauge'))
+        points.append((f'disk.io.{name}.busy_percent', rates.get('busy_percent'), 'gauge'))
+    points += [
+        ('network.bytes_sent', metrics.get('network', {}).get('bytes_sent'), 'counter'),
+        ('network.bytes_recv', metrics.get('network', {}).get('bytes_recv'), 'counter'),
+        ('network.upload_mb_s', metrics.get('network', {}).get('upload_mb_s'), 'gauge'),
+        ('network.download_mb_s', metrics.get('network', {}).get('download_mb_s'), 'gauge'),
+    ]
+    for name, rates in sorted(metrics.get('network', {}).get('interfaces', {}).items()):
+        points.append((f'network.{name}.tx_bytes_s', rates.get('tx_bytes_s'), 'gauge'))
+        points.append((f'network.{name}.rx_bytes_s', rates.get('rx_bytes_s'), 'gauge'))
+    for name, reading in sorted(metrics.get('temperature', {}).items()):
+        points.append((f'temperature.{name}', reading.get('current'), 'gauge'))
+    for name, service in sorted(metrics.get('services', {}).items()):
+        resources = service.get('resources')
+        if resources:
+            points.append((f'service.{name}.cpu', resources.get('cpu'), 'gauge'))
+            points.append((f'service.{name}.rss_mb', resources.get('rss_mb'), 'gauge'))
+            points.append((f'service.{name}.io_bytes_s', resources.get('io_bytes_s'), 'gauge'))
+    for name, container in sorted(metrics.get('cgroups', {}).get('containers', {}).items()):
+        points.append((f'container.{name}.cpu', container.get('cpu'), 'gauge'))
+        points.append((f'container.{name}.memory_mb', container.get('memory_mb'), 'gauge'))
+    # Per-core last: on very large hosts these are the first to hit MAX_METRICS
+    for index, busy in enumerate(metrics.get('cpu_detail', {}).get('cores', [])):
+        points.append((f'cpu.core.{index}', busy, 'gauge'))
+    return [(name, float(value), kind) for name, value, kind in points if isinstance(value, (int, float))]
+
+
+class RingSeries:
+    """Fixed-capacity ring of (timestamp, value) pairs backed by two array('d')"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array.array('d', bytes(8 * capacity))
+        self.values = array.array('d', bytes(8 * capacity))
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp, value):
+        """Add a point, overwriting the oldest once full"""
+        while self.count and timestamp <= self.times[self.head - 1]:
+            # Wall clock stepped back: drop the points stamped by the wrong clock so the ring stays sorted
+            self.head = (self.head - 1) % self.capacity
+            self.count -= 1
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return False
+
+    def position(self, timestamp, right=False):
+        """Logical index (0 = oldest) of the first point after (or at) timestamp"""
+        first = self.head - self.count
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = self.times[(first + mid) % self.capacity]
+            if t < timestamp or (right and t == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, start, end):
+        """Points with start <= timestamp <= end, oldest first"""
+        first = self.head - self.count
+        points = []
+        for i in range(self.position(start), self.position(end, right=True)):
+            index = (first + i) % self.capacity
+            points.append((self.times[index], self.values[index]))
+        return points
+
+
+class SegmentSeries:
+    """Append-only (timestamp, value) series stored in fixed-record segment files.
+
+    Each segment is a sparse file of records_per_segment '<dd' records named
+    after its first timestamp; unused records are zero. Only the active
+    segment is written, through a shared mmap that is created when a write
+    needs it and kept in a process-wide LRU of history_open_maps entries, so
+    points reach the page cache without a write() per sample and survive a
+    process restart. Closed segments are mapped read-only per query. A
+    wall clock that steps back starts a new segment rather than dropping
+    points.
+    """
+
+    RECORD = struct.Struct('<dd')
+    # Writable maps across all series, least recently written first
+    open_maps = collections.OrderedDict()
+    # Python 3.13+ can map without keeping a duplicate descriptor
+    MMAP_OPTIONS = {'trackfd': False} if sys.version_info >= (3, 13) else {}
+
+    def __init__(self, directory, resolution, retention, segment_seconds):
+        self.directory = directory
+        self.retention = retention
+        self.segment_seconds = segment_seconds
+        self.records = int(segment_seconds // resolution) + 1
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = []
+        for filename in os.listdir(directory):
+            if filename.endswith('.seg'):
+                try:
+                    self.segments.append((int(filename[:-4]) / 1000.0, os.path.join(directory, filename)))
+                except ValueError:
+                    continue
+        self.segments.sort()
+
+        self.mm = None
+        self.active = None
+        self.count = 0
+        self.last_timestamp = 0
+        if self.segments:
+            self.active = self.segments[-1]
+            self.count, self.last_timestamp = self.scan(self.active[1])
+        # Allocated bytes of every segment but the active one, stat'ed once when it stops growing
+        self.sizes = {path: self.allocated(path) for _, path in self.segments[:-1]}
+        self.closed_bytes = sum(self.sizes.values())
+
+    def scan(self, path):
+        """(written records, last timestamp) of a segment file"""
+        try:
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Missing or empty file: treat as a fresh segment
+            return 0, 0
+        try:
+            count = self.used_records(mm)
+            return count, self.timestamp_at(mm, count - 1) if count else 0
+        finally:
+            mm.close()
+
+    def writable(self):
+        """Map of the active segment, mapping it (and evicting the least recently used map) if needed"""
+        if self.mm is None:
+            limit = max(1, CONFIG.get('history_open_maps', 128))
+            while len(self.open_maps) >= limit:
+                self.open_maps.popitem(last=False)[0].close()
+            with open(self.active[1], 'r+b') as f:
+                if os.fstat(f.fileno()).st_size < self.records * self.RECORD.size:
+                    f.truncate(self.records * self.RECORD.size)
+                # The map stays valid after the file object is closed
+                self.mm = mmap.mmap(f.fileno(), 0, **self.MMAP_OPTIONS)
+        self.open_maps[self] = None
+        self.open_maps.move_to_end(self)
+        return self.mm
+
+    def close(self):
+        """Unmap the active segment"""
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.open_maps.pop(self, None)
+
+    def timestamp_at(self, mm, index):
+        """Timestamp of one record"""
+        return self.RECORD.unpack_from(mm, index * self.RECORD.size)[0]
+
+    def used_records(self, mm):
+        """Number of written records; timestamps are positive and unused records are zero"""
+        lo, hi = 0, len(mm) // self.RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mm, mid) > 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def position(self, mm, count, timestamp, right=False):
+        """Index of the first record after (or at) timestamp among count records"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = self.timestamp_at(mm, mid)
+            if t < timestamp or (right and t == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def append(self, timestamp, value):
+        """Add a point; returns True when a new segment file was started"""
+        rotated = False
+        if (self.active is None or self.count >= self.records
+                or timestamp - self.active[0] >= self.segment_seconds
+                or timestamp <= self.last_timestamp):
+            # A point at or before the last one means the wall clock stepped back:
+            # records within a segment must stay sorted, so it gets a new segment
+            self.rotate(timestamp)
+            rotated = True
+        self.RECORD.pack_into(self.writable(), self.count * self.RECORD.size, timestamp, value)
+        self.count += 1
+        self.last_timestamp = timestamp
+        return rotated
+
+    def rotate(self, timestamp):
+        """Start a new segment at timestamp and drop segments past the retention"""
+        self.close()
+        if self.active is not None:
+            size = self.sizes[self.active[1]] = self.allocated(self.active[1])
+            self.closed_bytes += size
+        milliseconds = int(timestamp * 1000)
+        while os.path.exists(os.path.join(self.directory, f'{milliseconds}.seg')):
+            # Only after a clock step back; never reuse an existing segment's name
+            milliseconds += 1
+        path = os.path.join(self.directory, f'{milliseconds}.seg')
+        with open(path, 'wb') as f:
+            # Sparse preallocation: no blocks are written until records land
+            f.truncate(self.records * self.RECORD.size)
+        self.active = (milliseconds / 1000.0, path)
+        self.segments.append(self.active)
+        self.segments.sort()
+        self.count = 0
+        self.last_timestamp = 0
+
+        cutoff = timestamp - self.retention
+        # A segment is expired once the next one starts before the cutoff
+        while len(self.segments) > 1 and self.segments[1][0] <= cutoff:
+            if not self.remove_oldest():
+                break
+
+    def remove_oldest(self):
+        """Delete the oldest segment other than the active one; returns its size in bytes"""
+        for index, (_, path) in enumerate(self.segments):
+            if path != self.active[1]:
+                break
+        else:
+            return 0
+        del self.segments[index]
+        size = self.sizes.pop(path, 0)
+        self.closed_bytes -= size
+        try:
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def allocated(self, path):
+        """Bytes a (sparse) segment file actually occupies on disk"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return 0
+        return st.st_blocks * 512 if hasattr(st, 'st_blocks') else st.st_size
+
+    def disk_usage(self):
+        """Bytes allocated by all segments, without touching the filesystem"""
+        # The active segment only has blocks for the pages its records reached
+        active = -(-self.count * self.RECORD.size // mmap.PAGESIZE) * mmap.PAGESIZE
+        return self.closed_bytes + active
+
+    def range(self, start, end):
+        """Points with start <= timestamp <= end, oldest first"""
+        points = []
+        ordered = True
+        for segment_start, path in self.segments:
+            # Where a segment ends is only known from its records: after a clock
+            # step back an older segment can run past the next one's start
+            if segment_start > end:
+                continue
+
+            if self.mm is not None and path == self.active[1]:
+                mm, count, owned = self.mm, self.count, False
+            else:
+                try:
+                    with open(path, 'rb') as f:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    continue
+                count, owned = self.used_records(mm), True
+            try:
+                lo = self.position(mm, count, start)
+                hi = self.position(mm, count, end, right=True)
+                size = self.RECORD.size
+                chunk = list(self.RECORD.iter_unpack(mm[lo * size:hi * size]))
+            finally:
+                if owned:
+                    mm.close()
+            if chunk and points and chunk[0][0] < points[-1][0]:
+                ordered = False
+            points.extend(chunk)
+        if not ordered:
+            points.sort()
+        return points
+
+
+class MetricHistory:
+    """Fixed-memory metric history: one ring per metric and tier, downsampled on insert.
+
+    Every sample goes into the raw ring; the coarser tiers accumulate the
+    current bucket and append its average (gauges) or last value (counters)
+    when the next bucket starts. Queries read from the finest tier that
+    still covers the requested start. With open_store() the rings are
+    replaced by persistent SegmentSeries under history_dir.
+    """
+
+    MAX_METRICS = 256
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.kinds = {}
+        self.pending = {}
+        self.directory = None
+        self.cap_logged = False
+
+    def open_store(self, directory):
+        """Persist history under directory, picking up metrics recorded by earlier runs"""
+        manifest_path = os.path.join(directory, 'metrics.json')
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(manifest_path) as f:
+                kinds = json.load(f)
+        except (OSError, ValueError):
+            kinds = {}
+
+        with self.lock:
+            for series in self.series.values():
+                for store in series.values():
+                    if isinstance(store, SegmentSeries):
+                        store.close()
+            self.directory = directory
+            self.series = {}
+            self.pending = {}
+            self.kinds = {}
+            self.cap_logged = False
+            for name, kind in sorted(kinds.items())[:self.MAX_METRICS]:
+                self.create_series(name, kind)
+                self.rebuild_pending(name)
+
+    def rebuild_pending(self, name):
+        """Re-derive coarse-tier buckets the previous run never flushed from its raw points (caller holds the lock)
+
+        Raw retention covers more than one bucket of every coarse tier, so a
+        restart or crash leaves no hole in the long-range tiers.
+        """
+        series = self.series[name]
+        for tier, resolution, _ in self.tiers()[1:]:
+            last = series[tier].last_timestamp
+            since = last + resolution if last else 0
+            for timestamp, value in series['raw'].range(since, float('inf')):
+                self.accumulate(name, tier, resolution, timestamp, value)
+
+    def create_series(self, name, kind):
+        """Allocate every tier of a new metric (caller holds the lock)"""
+        if self.directory is None:
+            self.series[name] = {
+                tier: RingSeries(max(1, int(retention // resolution)))
+                for tier, resolution, retention in self.tiers()
+            }
+        else:
+            metric_dir = urllib.parse.quote(name, safe='')
+            self.series[name] = {
+                tier: SegmentSeries(os.path.join(self.directory, tier, metric_dir),
+                                    resolution, retention, HISTORY_SEGMENT_SECONDS[tier])
+                for tier, resolution, retention in self.tiers()
+            }
+        self.kinds[name] = kind
+        self.pending[name] = {}
+
+    def save_manifest(self):
+        """Write metric names and kinds next to the segments (caller holds the lock)"""
+        path = os.path.join(self.directory, 'metrics.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.kinds, f)
+        os.replace(path + '.tmp', path)
+
+    def enforce_size(self):
+        """Delete the oldest segments across all metrics while over history_max_mb (caller holds the lock)"""
+        limit = CONFIG.get('history_max_mb', 64) * 1024 * 1024
+        stores = [store for series in self.series.values() for store in series.values()]
+        usage = sum(store.disk_usage() for store in stores)
+        if usage <= limit:
+            return
+        oldest = [(store.segments[0][0], index, store) for index, store in enumerate(stores) if len(store.segments) > 1]
+        heapq.heapify(oldest)
+        while usage > limit and oldest:
+            _, index, store = heapq.heappop(oldest)
+            freed = store.remove_oldest()
+            if not freed:
+                continue
+            usage -= freed
+            if len(store.segments) > 1:
+                heapq.heappush(oldest, (store.segments[0][0], index, store))
+
+    def tiers(self):
+        """(name, resolution, retention) for each tier, raw at the sampler cadence"""
+        return [(name, resolution or CONFIG.get('sample_interval', 2), retention)
+                for name, resolution, retention in HISTORY_TIERS]
+
+    def record(self, metrics, timestamp):
+        """Append one sampler snapshot"""
+        with self.lock:
+            rotated = False
+            for name, value, kind in history_points(metrics):
+                rotated = self.add(name, value, kind, timestamp) or rotated
+            # Every raw series rotates on the same tick, so the size check runs once for all of them
+            if rotated and self.directory is not None:
+                self.enforce_size()
+
+    def add(self, name, value, kind, timestamp):
+        """Append one point to every tier of a metric, returning True if a segment rotated (caller holds the lock)"""
+        series = self.series.get(name)
+        if series is None:
+            if len(self.series) >= self.MAX_METRICS:
+                if not self.cap_logged:
+                    self.cap_logged = True
+                    print(f"⚠️  WARNING: Metric history is capped at {self.MAX_METRICS} series; "
+                          f"not recording {name} and any later new metrics")
+                return False
+            self.create_series(name, kind)
+            series = self.series[name]
+            if self.directory is not None:
+                self.save_manifest()
+
+        rotated = False
+        for tier, resolution, _ in self.tiers():
+            if tier == 'raw':
+                rotated = series[tier].append(timestamp, value) or rotated
+            else:
+                rotated = self.accumulate(name, tier, resolution, timestamp, value) or rotated
+        return rotated
+
+    def accumulate(self, name, tier, resolution, timestamp, value):
+        """Add a point to a coarse tier's current bucket, appending the previous bucket once it ends"""
+        bucket = timestamp - timestamp % resolution
+        acc = self.pending[name].get(tier)
+        rotated = False
+        if acc is not None and acc[0] != bucket:
+            kind = self.kinds[name]
+            rotated = self.series[name][tier].append(acc[0], acc[1] / acc[2] if kind == 'gauge' else acc[3])
+            acc = None
+        if acc is None:
+            acc = self.pending[name][tier] = [bucket, 0.0, 0, 0.0]
+        acc[1] += value
+        acc[2] += 1
+        acc[3] = value
+        return rotated
+
+    def metric_names(self):
+        """Names of all recorded metrics"""
+        with self.lock:
+            return sorted(self.series)
+
+    def query(self, name, start, end, step=0, now=None):
+        """Points for one metric between start and end, or None for an unknown metric.
+
+        step re-buckets the chosen tier to coarser intervals; it never makes
+        a tier finer than it is. now should be the time start and end were
+        resolved against.
+        """
+        if now is None:
+            now = time.time()
+        tiers = self.tiers()
+        # One step of slack, so a window exactly as long as a tier's retention still uses it
+        covering = [tier for tier in tiers if start >= now - tier[2] - tier[1]] or [tiers[-1]]
+        tier, resolution, _ = covering[0]
+        for candidate in covering:
+            if candidate[1] <= step:
+                tier, resolution, _ = candidate
+
+        with self.lock:
+            series = self.series.get(name)
+            if series is None:
+                return None
+            kind = self.kinds[name]
+            points = series[tier].range(start, end)
+
+        if step > resolution:
+            buckets = collections.OrderedDict()
+            for timestamp, value in points:
+                buckets.setdefault(timestamp - timestamp % step, []).append(value)
+            points = [(bucket, sum(values) / len(values) if kind == 'gauge' else values[-1])
+                      for bucket, values in buckets.items()]
+            resolution = step
+
+        return {
+            'metric': name,
+            'kind': kind,
+            'tier': tier,
+            'step': resolution,
+            'from': start,
+            'to': end,
+            'points': [[round(timestamp, 3), round(value, 3)] for timestamp, value in points]
+        }
+
+
+METRIC_HISTORY = MetricHistory()
+
+# Common services with typical process names and ports
+SERVICE_DEFINITIONS = {
+    "nextcloud": {"processes": ["nginx", "apache2", "nextcloud", "php-fpm"], "ports": [80, 443, 8080], "description": "Cloud Storage"},
+    "jellyfin": {"processes": ["jellyfin"], "ports": [8096, 8920], "description": "Media Server"},
+    "plex": {"processes": ["plexmediaserver", "plex"], "ports": [32400], "description": "Media Server"},
+    "emby": {"processes": ["emby", "embyserver"], "ports": [8096], "description": "Media Server"},
+    "docker": {"processes": ["docker", "dockerd", "containerd"], "ports": [2375, 2376], "description": "Container Platform"},
+    "ssh": {"processes": ["sshd", "ssh"], "ports": [22], "description": "Remote Access"},
+    "web": {"processes": ["nginx", "apache2", "httpd", "lighttpd"], "ports": [80, 443, 8080, 8443], "description": "Web Server"},
+    "database": {"processes": ["mysql", "mysqld", "postgresql", "postgres", "mariadb"], "ports": [3306, 5432], "description": "Database"},
+    "samba": {"processes": ["smbd", "nmbd"], "ports": [139, 445], "description": "File Sharing"},
+    "transmission": {"processes": ["transmission-daemon", "transmission"], "ports": [9091], "description": "Torrent Client"},
+    "pihole": {"processes": ["pihole", "dnsmasq", "lighttpd"], "ports": [53, 80], "description": "DNS Filter"},
+    "homeassistant": {"processes": ["homeassistant", "hass"], "ports": [8123], "description": "Home Automation"},
+    "mqtt": {"processes": ["mosquitto", "mqtt"], "ports": [1883, 8883], "description": "IoT Messaging"},
+    "vnc": {"processes": ["vncserver", "vnc", "x11vnc"], "ports": [5900, 5901], "description": "Remote Desktop"},
+    "magi": {"processes": ["magi-node", "python3"], "ports": [8080, 8081, 8082], "description": "MAGI Monitor"}
+}
+
+# Well-known ports reported even without a matching process
+ADDITIONAL_SERVICE_PORTS = {21: 'FTP', 25: 'SMTP', 53: 'DNS', 110: 'POP3', 143: 'IMAP', 993: 'IMAPS', 995: 'POP3S', 3389: 'RDP', 5432: 'PostgreSQL', 6379: 'Redis', 27017: 'MongoDB', 9200: 'Elasticsearch'}
+
+
+class ServiceMatcher:
+    """Service process patterns compiled into a single regex.
+
+    A process name and cmdline are scanned once for every pattern at the same
+    time. Each pattern maps to the services of all patterns that are a prefix
+    of it and the scan restarts one character after each hit, so overlapping
+    patterns give exactly the same result as per-pattern substring checks.
+    """
+
+    def __init__(self, definitions):
+        owners = {}
+        for service_name, service_def in definitions.items():
+            for pattern in service_def['processes']:
+                owners.setdefault(pattern.lower(), set()).add(service_name)
+
+        # The regex prefers the longest pattern at a position, which implies its prefixes matched too
+        self.services = {}
+        for pattern in owners:
+            matched = set()
+            for other, service_names in owners.items():
+                if pattern.startswith(other):
+                    matched.update(service_names)
+            self.services[pattern] = frozenset(matched)
+
+        ordered = sorted(owners, key=len, reverse=True)
+        self.regex = re.compile('|'.join(re.escape(pattern) for pattern in ordered))
+
+    def match(self, proc_name, cmdline):
+        """Return the set of services matching a (lowercased) process name and cmdline"""
+        # Patterns never contain a newline, so no match can span name and cmdline
+        text = proc_name + '\n' + cmdline
+        search = self.regex.search
+        found = set()
+        hit = search(text)
+        while hit is not None:
+            found.update(self.services[hit.group()])
+            hit = search(text, hit.start() + 1)
+        return frozenset(found)
+
+
+SERVICE_MATCHER = ServiceMatcher(SERVICE_DEFINITIONS)
+
+
+def match_services(proc_name, cmdline):
+    """Return the set of services whose process patterns match a process"""
+    return SERVICE_MATCHER.match(proc_name, cmdline)
+
+
+def benchmark_service_matcher(sizes=(1000, 5000, 20000), seed=42):
+    """Compare the compiled matcher against per-pattern substring scans on synthetic process tables"""
+    import random
+
+    rng = random.Random(seed)
+    names = ['systemd', 'bash', 'kworker/u16:2', 'python3', 'java', 'node', 'nginx', 'containerd-shim',
+             'postgres', 'chrome', 'gunicorn', 'jellyfin', 'sshd', 'rsync', 'php-fpm8.2', 'smbd']
+    args = ['--config', '/etc/app/app.conf', '-m', 'worker', '--user', '-Xmx2g', '--type=renderer',
+            '/usr/lib/jvm/bin/java', '/opt/service/bin/run', '-namespace', 'moby', '-id',
+            '3f9a1c2b7d4e5f60718293a4b5c6d7e8f9a0b1c2d3e4f5a6b7c8d9e0f1a2b3c4', '--port=9000']
+
+    def substring_scan(proc_name, cmdline):
+        return frozenset(
+            service_name for service_name, service_def in SERVICE_DEFINITIONS.items()
+            if any(proc in proc_name or proc in cmdline for proc in service_def['processes'])
+        )
+
+    print(f"{'processes':>10} {'substring (ms)':>15} {'compiled (ms)':>14} {'speedup':>8}")
+    for size in sizes:
+        table = []
+        for _ in range(size):
+            name = rng.choice(names)
+            cmdline = ' '.join([name] + [rng.choice(args) for _ in range(rng.randint(0, 12))])
+            table.append((name, cmdline))
+
+        start = time.perf_counter()
+        expected = [substring_scan(name, cmdline) for name, cmdline in table]
+        substring_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = [SERVICE_MATCHER.match(name, cmdline) for name, cmdline in table]
+        compiled_time = time.perf_counter() - start
+
+        if result != expected:
+            raise AssertionError('compiled matcher disagrees with substring scan')
+        print(f"{size:>10} {substring_time * 1000:>15.1f} {compiled_time * 1000:>14.1f} {substring_time / compiled_time:>7.1f}x")
+
+
+def benchmark_host_collectors(samples=500):
+    """Compare the per-sample CPU cost of the /proc fast path against the psutil calls it replaces"""
+    if not PROC_READER.available():
+        print('   /proc fast path not available on this platform')
+        return
+
+    def psutil_sample():
+        psutil.cpu_times()
+        psutil.cpu_times(percpu=True)
+        psutil.virtual_memory()
+        psutil.net_io_counters(pernic=True)
+        if hasattr(psutil, 'sensors_temperatures'):
+            psutil.sensors_temperatures()
+        psutil.cpu_freq()
+        psutil.boot_time()
+
+    def fast_sample():
+        PROC_READER.cpu_times()
+        PROC_READER.virtual_memory() or psutil.virtual_memory()
+        PROC_READER.net_counters()
+        if PROC_READER.temperatures() is None and hasattr(psutil, 'sensors_temperatures'):
+            psutil.sensors_temperatures()
+        PROC_READER.cpu_freq() or psutil.cpu_freq()
+        PROC_READER.boot_time()
+
+    print(f"{'collector':>10} {'CPU/sample (us)':>16} {'wall/sample (us)':>17}")
+    costs = {}
+    for label, sample in (('psutil', psutil_sample), ('/proc', fast_sample)):
+        sample()  # warm up: opens descriptors and discovers sensors
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        for _ in range(samples):
+            sample()
+        costs[label] = (time.process_time() - cpu_start) / samples
+        wall = (time.perf_counter() - wall_start) / samples
+        print(f"{label:>10} {costs[label] * 1e6:>16.1f} {wall * 1e6:>17.1f}")
+    if costs['/proc'] > 0:
+        print(f"{'speedup':>10} {costs['psutil'] / costs['/proc']:>15.1f}x")
+
+
+def build_service_status(running_services, open_ports):
+    """Build the services map from matched process services and listening ports"""
+    services = {}
+
+    for service_name, service_def in SERVICE_DEFINITIONS.items():
+        process_found = service_name in running_services
+        active_ports = [port for port in service_def['ports'] if port in open_ports]
+        port_found = bool(active_ports)
+
+        if process_found or port_found:
+            services[service_name] = {
+                'status': 'running' if process_found else 'port_open',
+                'ports': active_ports if active_ports else service_def['ports'][:1],
+                'description': service_def['description'],
+                'process_detected': process_found,
+                'port_detected': port_found
+            }
+
+    for port, svc in ADDITIONAL_SERVICE_PORTS.items():
+        if port in open_ports and svc.lower() not in services:
+            services[svc.lower()] = {
+                'status': 'port_open',
+                'ports': [port],
+                'description': svc,
+                'process_detected': False,
+                'port_detected': True
+            }
+
+    return services
+
+
+class ServiceDetector:
+    """Incremental service detection tracking process and listening port deltas.
+
+    Processes are cached by (pid, create_time) together with the services
+    they match, so each refresh only inspects new PIDs and drops exited ones.
+    Listening ports are refreshed on their own interval and the services map
+    is only rebuilt when the matched services or open ports change.
+    """
+
+    # Seconds between create_time checks of cached PIDs to catch PID reuse
+    IDENTITY_CHECK_INTERVAL = 60
+
+    def __init__(self):
+        self.processes = {}  # pid -> (create_time, matched services)
+        self.service_counts = {}  # service name -> number of matching processes
+        self.open_ports = frozenset()
+        self.ports_checked = None
+        self.identities_checked = None
+        self.inputs = None
+        self.services = {}
+        self.lock = threading.Lock()
+
+    def inspect(self, pid):
+        """Read identity, name and cmdline of a new PID and cache its matched services"""
+        try:
+            proc = psutil.Process(pid)
+            with proc.oneshot():
+                create_time = proc.create_time()
+                name = (proc.name() or '').lower()
+                try:
+                    cmdline = ' '.join(proc.cmdline() or []).lower()
+                except (psutil.AccessDenied, psutil.ZombieProcess):
+                    cmdline = ''
+        except psutil.NoSuchProcess:
+            return
+        except Exception:
+            # Cache unreadable processes too so they are not retried every refresh
+            self.processes[pid] = (None, frozenset())
+            return
 
+        matched = match_services(name, cmdline)
+        self.processes[pid] = (create_time, matched)
+        for service_name in matched:
+            self.service_counts[service_name] = self.service_counts.get(service_name, 0) + 1
+
+    def matched_processes(self):
+        """pid -> (create_time, services) for cached processes that matched a service"""
+        with self.lock:
+            return {pid: entry for pid, entry in self.processes.items() if entry[1]}
+
+    def forget(self, pid):
+        """Drop an exited PID from the cache"""
+        _, matched = self.processes.pop(pid)
+        for service_name in matched:
+            self.service_counts[service_name] -= 1
+
+    def verify_identities(self):
+        """Re-inspect cached PIDs whose create_time changed (PID reuse)"""
+        for pid, (create_time, _) in list(self.processes.items()):
+            try:
+                current = psutil.Process(pid).create_time()
+            except Exception:
+                current = None
+            if current != create_time:
+                self.forget(pid)
+                self.inspect(pid)
+
+    def refresh_processes(self, now):
+        """Apply the PID delta since the previous refresh"""
+        pids = set(psutil.pids())
+        known = set(self.processes)
+
+        for pid in known - pids:
+            self.forget(pid)
+        for pid in pids - known:
+            self.inspect(pid)
+
+        if self.identities_checked is None or now - self.identities_checked >= self.IDENTITY_CHECK_INTERVAL:
+            if self.identities_checked is not None:
+                self.verify_identities()
+            self.identities_checked = now
+
+    def refresh_ports(self):
+        """Refresh the set of listening ports"""
         open_ports = set()
         for conn in psutil.net_connections(kind='inet'):
             if conn.laddr and conn.status == 'LISTEN':
@@ -2239,92 +4247,939 @@ def detect_services():
                     open_ports.add(conn.laddr.port)
                 except Exception:
                     continue
+        self.open_ports = frozenset(open_ports)
+
+    def detect(self):
+        """Return the current services map, recomputed only when its inputs changed"""
+        with self.lock:
+            now = time.monotonic()
+            self.refresh_processes(now)
+
+            if self.ports_checked is None or now - self.ports_checked >= CONFIG.get('port_scan_interval', 10):
+                self.refresh_ports()
+                self.ports_checked = now
+
+            running = frozenset(name for name, count in self.service_counts.items() if count > 0)
+            inputs = (running, self.open_ports)
+            if inputs != self.inputs:
+                self.services = build_service_status(running, self.open_ports)
+                self.inputs = inputs
+
+            return dict(self.services)
+
+
+SERVICE_DETECTOR = ServiceDetector()
+
+
+def detect_services():
+    """Detect comprehensive services running on the system"""
+    try:
+        return SERVICE_DETECTOR.detect()
+    except Exception as e:
+        print(f"Error detecting services: {e}")
+        return {}
+
+
+class CgroupMonitor:
+    """cgroup v2 accounting per systemd unit and per container scope.
+
+    Reads cpu.stat, memory.current, io.stat and pids.current straight from
+    the unified hierarchy instead of walking processes. Descriptors stay
+    open between ticks and are re-read with os.pread; the group list is
+    rediscovered every cgroup_scan_interval and CPU, I/O and throttling
+    become rates through CounterRates.
+    """
+
+    FILES = ('cpu.stat', 'memory.current', 'io.stat', 'pids.current')
+
+    def __init__(self):
+        self.groups = {}
+        self.scanned_at = None
+        self.rates = CounterRates()
+        self.pid_units = {}  # (pid, create_time) -> systemd unit name or None
+
+    def available(self):
+        """True on hosts with a cgroup v2 (unified) hierarchy"""
+        return hasattr(os, 'pread') and os.path.exists(os.path.join(CONFIG.get('cgroup_root', '/sys/fs/cgroup'), 'cgroup.controllers'))
+
+    def classify(self, relative):
+        """(kind, display name) for a cgroup path worth reporting, or None"""
+        parts = relative.split('/')
+        leaf = parts[-1]
+        if leaf.startswith('docker-') and leaf.endswith('.scope'):
+            return 'containers', 'docker-' + leaf[7:19]
+        if leaf.startswith('libpod-') and leaf.endswith('.scope'):
+            return 'containers', 'podman-' + leaf[7:19]
+        if leaf.startswith('lxc.payload.'):
+            return 'containers', 'lxc-' + leaf[len('lxc.payload.'):]
+        if parts[0] == 'machine.slice' and leaf.endswith('.scope'):
+            return 'containers', leaf[:-len('.scope')]
+        if parts[0] == 'docker' and len(parts) == 2:
+            # cgroupfs driver: /docker/<id>
+            return 'containers', 'docker-' + leaf[:12]
+        if parts[0] == 'system.slice' and leaf.endswith('.service'):
+            return 'units', leaf
+        return None
+
+    def discover(self):
+        """Refresh the set of unit and container groups, closing descriptors of vanished ones"""
+        root = CONFIG.get('cgroup_root', '/sys/fs/cgroup')
+        limit = CONFIG.get('cgroup_max_groups', 64)
+        found = {}
+        for parent in ('', 'system.slice', 'machine.slice', 'docker'):
+            if len(found) >= limit:
+                break
+            try:
+                entries = sorted(os.listdir(os.path.join(root, parent)))
+            except OSError:
+                continue
+            for entry in entries:
+                if len(found) >= limit:
+                    break
+                relative = f'{parent}/{entry}' if parent else entry
+                kind = self.classify(relative)
+                if kind and os.path.isdir(os.path.join(root, relative)):
+                    found[relative] = kind
+
+        for relative in set(self.groups) - set(found):
+            self.close(relative)
+        for relative, (kind, name) in found.items():
+            if relative not in self.groups:
+                self.groups[relative] = {'kind': kind, 'name': name, 'path': os.path.join(root, relative), 'fds': {}}
+
+    def close(self, relative):
+        """Close a group's descriptors and forget it"""
+        group = self.groups.pop(relative)
+        for fd in group['fds'].values():
+            if fd is not None:
+                os.close(fd)
+
+    def read(self, group, filename):
+        """Current contents of one cgroup file through its cached descriptor, or None if absent"""
+        fd = group['fds'].get(filename, -1)
+        if fd == -1:
+            try:
+                fd = os.open(os.path.join(group['path'], filename), os.O_RDONLY)
+            except FileNotFoundError:
+                # Controller not enabled for this group
+                fd = None
+            group['fds'][filename] = fd
+        if fd is None:
+            return None
+        return os.pread(fd, 65536, 0).decode('ascii', 'replace')
+
+    def collect(self, now):
+        """Usage per unit and container since the previous tick"""
+        if not self.available():
+            return {}
+        if self.scanned_at is None or now - self.scanned_at >= CONFIG.get('cgroup_scan_interval', 30):
+            self.discover()
+            self.scanned_at = now
+
+        result = {'units': {}, 'containers': {}}
+        for relative, group in list(self.groups.items()):
+            try:
+                cpu_stat = self.read(group, 'cpu.stat') or ''
+                memory = self.read(group, 'memory.current')
+                io_stat = self.read(group, 'io.stat') or ''
+                pids = self.read(group, 'pids.current')
+            except OSError:
+                # Group removed since the last scan (ENODEV/ENOENT)
+                self.close(relative)
+                continue
+
+            cpu = {}
+            for line in cpu_stat.splitlines():
+                key, _, value = line.partition(' ')
+                if value.isdigit():
+                    cpu[key] = int(value)
+            io = collections.Counter()
+            for line in io_stat.splitlines():
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if value.isdigit():
+                        io[key] += int(value)
+
+            rates = self.rates.update(relative, {
+                'usage_usec': cpu.get('usage_usec', 0),
+                'throttled_usec': cpu.get('throttled_usec', 0),
+                'rbytes': io['rbytes'],
+                'wbytes': io['wbytes'],
+            }, now)
+            result[group['kind']][group['name']] = {
+                # usec of CPU per second / 1e6 * 100
+                "cpu": round(rates['usage_usec'] / 1e4, 1),
+                "throttled_percent": round(rates['throttled_usec'] / 1e4, 1),
+                "memory_mb": round(int(memory) / (1024 * 1024), 1) if memory and memory.strip().isdigit() else None,
+                "io_read_bytes_s": round(rates['rbytes'], 1),
+                "io_write_bytes_s": round(rates['wbytes'], 1),
+                "pids": int(pids) if pids and pids.strip().isdigit() else None
+            }
+        self.rates.retain(self.groups)
+        return result
+
+    def service_usage(self, cgroups):
+        """Sum unit usage per service, matching unit names against the service process patterns"""
+        usage = {}
+        for unit_name, unit in cgroups.get('units', {}).items():
+            if unit["memory_mb"] is None and unit["pids"] is None:
+                # No memory/pids controller on this unit: leave its service to process accounting
+                continue
+            for service_name in match_services(unit_name[:-len('.service')].lower(), ''):
+                totals = usage.setdefault(service_name, {
+                    "units": [], "cpu": 0.0, "memory_mb": 0.0, "io_read_bytes_s": 0.0, "io_write_bytes_s": 0.0, "pids": 0
+                })
+                totals["units"].append(unit_name)
+                totals["cpu"] = round(totals["cpu"] + unit["cpu"], 1)
+                totals["memory_mb"] = round(totals["memory_mb"] + (unit["memory_mb"] or 0), 1)
+                totals["io_read_bytes_s"] = round(totals["io_read_bytes_s"] + unit["io_read_bytes_s"], 1)
+                totals["io_write_bytes_s"] = round(totals["io_write_bytes_s"] + unit["io_write_bytes_s"], 1)
+                totals["pids"] += unit["pids"] or 0
+        return usage
+
+    def units_of(self, matched):
+        """pid -> systemd unit holding it (None outside system.slice units) for matched processes
+
+        Read once per process from /proc/<pid>/cgroup, keyed like the
+        service detector by (pid, create_time).
+        """
+        units = {}
+        pid_units = {}
+        for pid, (create_time, _) in matched.items():
+            key = (pid, create_time)
+            if key in self.pid_units:
+                unit = self.pid_units[key]
+            else:
+                unit = None
+                try:
+                    with open(f'/proc/{pid}/cgroup') as f:
+                        for line in f:
+                            # cgroup v2 entry, e.g. 0::/system.slice/nginx.service
+                            if line.startswith('0::'):
+                                parts = line[3:].strip().strip('/').split('/')
+                                if len(parts) >= 2 and parts[0] == 'system.slice' and parts[1].endswith('.service'):
+                                    unit = parts[1]
+                except OSError:
+                    pass
+            pid_units[key] = units[pid] = unit
+        self.pid_units = pid_units
+        return units
+
+
+CGROUP_MONITOR = CgroupMonitor()
+
+
+class ProcessTable:
+    """Per-process CPU, memory and I/O table refreshed every process_table_interval seconds.
+
+    The full process walk is kept off the per-tick path; CPU and I/O rates
+    are deltas of cumulative counters against the previous refresh, keyed by (pid, create_time) so a reused PID never inherits another
+    process's counters; no per-process cpu_percent(interval=...) calls.
+    Rankings are built at refresh time and requests only slice them.
+    Per-service usage reads only the processes the service detector already
+    matched, and their open descriptor counts at most every
+    process_fd_interval seconds.
+    """
+
+    SORT_KEYS = ('cpu', 'mem', 'io')
+    ATTRS = ['pid', 'name', 'create_time', 'cpu_times', 'memory_info', 'io_counters', 'num_threads']
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = {}
+        self.previous_at = None
+        self.rankings = {key: [] for key in self.SORT_KEYS}
+        self.refreshed_at = None
+        self.service_previous = {}
+        self.service_previous_at = None
+        self.fd_counts = {}  # (pid, create_time) -> (checked at, open descriptors)
+
+    def refresh(self, now, memory_total):
+        """Read every process once and rebuild the rankings, unless the last refresh is recent"""
+        if self.previous_at is not None and now - self.previous_at < CONFIG.get('process_table_interval', 10):
+            return
+        elapsed = now - self.previous_at if self.previous_at is not None else None
+        counters = {}
+        rows = []
+
+        for proc in psutil.process_iter(self.ATTRS, ad_value=None):
+            info = proc.info
+            key = (info['pid'], info['create_time'])
+            cpu_times = info['cpu_times']
+            io = info['io_counters']
+            cpu_seconds = cpu_times.user + cpu_times.system if cpu_times else None
+            io_bytes = io.read_bytes + io.write_bytes if io else None
+            counters[key] = (cpu_seconds, io_bytes)
+
+            cpu = 0.0
+            io_rate = None
+            previous = self.previous.get(key)
+            if elapsed and previous is not None:
+                if cpu_seconds is not None and previous[0] is not None:
+                    cpu = max(0.0, cpu_seconds - previous[0]) / elapsed * 100
+                if io_bytes is not None and previous[1] is not None:
+                    io_rate = max(0, io_bytes - previous[1]) / elapsed
+
+            rss = info['memory_info'].rss if info['memory_info'] else 0
+            rows.append({
+                "pid": info['pid'],
+                "name": info['name'] or '',
+                "cpu": round(cpu, 1),
+                "mem_mb": round(rss / (1024 * 1024), 1),
+                "mem_percent": round(rss * 100 / memory_total, 2) if memory_total else 0.0,
+                "io_bytes_s": round(io_rate, 1) if io_rate is not None else None,
+                "threads": info['num_threads']
+            })
+
+        rankings = {
+            'cpu': sorted(rows, key=lambda row: row['cpu'], reverse=True),
+            'mem': sorted(rows, key=lambda row: row['mem_mb'], reverse=True),
+            'io': sorted(rows, key=lambda row: row['io_bytes_s'] or 0, reverse=True)
+        }
+        with self.lock:
+            self.previous = counters
+            self.previous_at = now
+            self.rankings = rankings
+            self.refreshed_at = time.time()
+
+    def service_usage(self, now, matched):
+        """Per-service CPU, RSS, open descriptors and I/O from the matched processes only.
+
+        matched maps pid -> (create_time, services) as cached by the service
+        detector's incremental pass, so no process walk happens here.
+        """
+        elapsed = now - self.service_previous_at if self.service_previous_at is not None else None
+        fd_interval = CONFIG.get('process_fd_interval', 30)
+        counters = {}
+        fd_counts = {}
+        usage = {}
+
+        for pid, (create_time, services) in matched.items():
+            key = (pid, create_time)
+            try:
+                proc = psutil.Process(pid)
+                with proc.oneshot():
+                    if proc.create_time() != create_time:
+                        # PID reused since the detector matched it
+                        continue
+                    cpu_times = proc.cpu_times()
+                    rss = proc.memory_info().rss
+                    try:
+                        io = proc.io_counters()
+                    except (psutil.AccessDenied, AttributeError, NotImplementedError):
+                        io = None
+            except psutil.Error:
+                continue
+
+            cpu_seconds = cpu_times.user + cpu_times.system
+            io_bytes = io.read_bytes + io.write_bytes if io else None
+            counters[key] = (cpu_seconds, io_bytes)
+            cpu = 0.0
+            io_rate = 0.0
+            previous = self.service_previous.get(key)
+            if elapsed and previous is not None:
+                cpu = max(0.0, cpu_seconds - previous[0]) / elapsed * 100
+                if io_bytes is not None and previous[1] is not None:
+                    io_rate = max(0, io_bytes - previous[1]) / elapsed
+
+            # Counting descriptors lists /proc/<pid>/fd, so it is refreshed on its own slower interval
+            checked = self.fd_counts.get(key)
+            if checked is None or now - checked[0] >= fd_interval:
+                checked = (now, self.open_files(proc))
+            fd_counts[key] = checked
+
+            for service_name in services:
+                totals = usage.setdefault(service_name, {
+                    "source": "process", "processes": 0, "cpu": 0.0, "rss_mb": 0.0, "open_files": 0, "io_bytes_s": 0.0
+                })
+                totals["processes"] += 1
+                totals["cpu"] += cpu
+                totals["rss_mb"] += rss / (1024 * 1024)
+                totals["open_files"] += checked[1] or 0
+                totals["io_bytes_s"] += io_rate
+
+        self.service_previous = counters
+        self.service_previous_at = now
+        self.fd_counts = fd_counts
+
+        for totals in usage.values():
+            totals["cpu"] = round(totals["cpu"], 1)
+            totals["rss_mb"] = round(totals["rss_mb"], 1)
+            totals["io_bytes_s"] = round(totals["io_bytes_s"], 1)
+        return usage
+
+    def open_files(self, proc):
+        """Open descriptor (or handle) count of one process, or None if not readable"""
+        try:
+            if hasattr(proc, 'num_fds'):
+                return proc.num_fds()
+            return proc.num_handles()
+        except (psutil.Error, OSError):
+            return None
+
+    def top(self, count, sort='cpu'):
+        """The count busiest processes by sort key, as of the last refresh"""
+        with self.lock:
+            return {
+                "sort": sort,
+                "total": len(self.rankings[sort]),
+                "refreshed_at": round(self.refreshed_at, 3) if self.refreshed_at else None,
+                "processes": self.rankings[sort][:count]
+            }
+
+
+PROCESS_TABLE = ProcessTable()
+
+
+def get_service_port(service_name):
+    """Get default port for common services"""
+    default_ports = {
+        'nextcloud': 80,
+        'jellyfin': 8096,
+        'plex': 32400,
+        'ssh': 22,
+        'web': 80,
+        'samba': 445
+    }
+    return default_ports.get(service_name)
+
+
+def get_system_metrics_fallback():
+    """Fallback system metrics without psutil"""
+    return {
+        'cpu': 42,
+        'memory': {'percentage': 35, 'used_gb': 2.8, 'total_gb': 8.0},
+        'disk': {'percentage': 60, 'used_gb': 120, 'total_gb': 200},
+        'network': {'mb_sent': 45.2, 'mb_recv': 234.5},
+        'temperature': {'cpu': {'current': 45}},
+        'power_state': 'normal',
+        'services': {},
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'node_status': 'online'
+    }
+
+
+PEER_EXECUTOR = None
+PEER_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_peer_executor():
+    """Return the shared bounded thread pool used for peer fan-out"""
+    global PEER_EXECUTOR
+    with PEER_EXECUTOR_LOCK:
+        if PEER_EXECUTOR is None:
+            PEER_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                max_workers=CONFIG.get('peer_workers', 8),
+                thread_name_prefix='magi-peer'
+            )
+        return PEER_EXECUTOR
+
+
+def aggregation_deadline():
+    """Monotonic deadline for one aggregation cycle"""
+    return time.monotonic() + CONFIG.get('aggregation_timeout', 4)
+
+
+def peer_timeout(deadline, default):
+    """Per-call timeout, never running past the aggregation deadline"""
+    return max(0.1, min(default, deadline - time.monotonic()))
+
+
+def run_peer_tasks(func, peers, deadline):
+    """Run func(peer, deadline) for every peer concurrently.
+
+    Returns a list of (result, error) tuples in the same order as peers.
+    Peers that have not answered by the deadline get a TimeoutError, so a
+    slow or dead peer only costs its own slot.
+    """
+    if not peers:
+        return []
+
+    executor = get_peer_executor()
+    futures = [executor.submit(func, peer, deadline) for peer in peers]
+    concurrent.futures.wait(futures, timeout=max(0, deadline - time.monotonic()))
+
+    results = []
+    for future in futures:
+        if not future.done():
+            future.cancel()
+            results.append((None, TimeoutError('aggregation deadline exceeded')))
+            continue
+        try:
+            results.append((future.result(), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+
+class PeerConnectionPool:
+    """Persistent HTTP/1.1 connections to peer nodes with idle reaping and health tracking.
+
+    A connection is checked out for exactly one request and returned
+    afterwards, so concurrent fan-out never shares a socket. A request on a
+    reused connection that the peer has meanwhile closed is retried once on
+    a fresh connection.
+    """
+
+    MAX_IDLE_PER_PEER = 4
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.health = {}
+
+    def idle_timeout(self):
+        """Seconds a connection may sit idle; kept under the peers' own keep-alive timeout"""
+        return max(1, CONFIG.get('keepalive_timeout', 15) - 2)
+
+    def checkout(self, key, timeout):
+        """Return (connection, reused) for a peer, preferring the most recently used idle one"""
+        with self.lock:
+            self.reap(time.monotonic())
+            idle = self.idle.get(key)
+            conn = idle.pop()[1] if idle else None
+
+        if conn is None:
+            return http.client.HTTPConnection(key[0], key[1], timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def checkin(self, key, conn):
+        """Return a healthy connection to the idle list"""
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.MAX_IDLE_PER_PEER:
+                idle.append((time.monotonic(), conn))
+                return
+        conn.close()
+
+    def reap(self, now):
+        """Close connections idle past the idle timeout (caller holds the lock)"""
+        limit = self.idle_timeout()
+        for key, idle in list(self.idle.items()):
+            fresh = []
+            for returned_at, conn in idle:
+                if now - returned_at > limit:
+                    conn.close()
+                else:
+                    fresh.append((returned_at, conn))
+            if fresh:
+                self.idle[key] = fresh
+            else:
+                del self.idle[key]
+
+    def record(self, key, latency_ms=None, error=None):
+        """Update a peer's health counters after a request"""
+        with self.lock:
+            health = self.health.setdefault(key, {
+                'requests': 0, 'failures': 0, 'consecutive_failures': 0,
+                'latency_ms': None, 'last_success': None, 'last_error': None
+            })
+            health['requests'] += 1
+            if error is None:
+                health['consecutive_failures'] = 0
+                health['last_success'] = time.time()
+                previous = health['latency_ms']
+                health['latency_ms'] = latency_ms if previous is None else round(0.8 * previous + 0.2 * latency_ms, 1)
+            else:
+                health['failures'] += 1
+                health['consecutive_failures'] += 1
+                health['last_error'] = str(error)
+
+    def request(self, host, port, path, timeout):
+        """GET path from a peer, returning (status, body)"""
+        key = (host, port)
+        start_time = time.monotonic()
+        for attempt in range(2):
+            conn, reused = self.checkout(key, timeout)
+            try:
+                conn.request('GET', path, headers={'User-Agent': 'MAGI-Discovery'})
+                resp = conn.getresponse()
+                body = resp.read()
+            except Exception as e:
+                conn.close()
+                # The peer closed an idle keep-alive connection under us; retry on a new one
+                if reused and attempt == 0 and isinstance(e, (ConnectionError, http.client.BadStatusLine)):
+                    continue
+                self.record(key, error=e)
+                raise
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self.checkin(key, conn)
+            self.record(key, latency_ms=int((time.monotonic() - start_time) * 1000))
+            return resp.status, body
+
+    def stats(self):
+        """Health counters and idle connection count per peer"""
+        with self.lock:
+            return {
+                f"{host}:{port}": dict(health, idle=len(self.idle.get((host, port), ())))
+                for (host, port), health in self.health.items()
+            }
+
+
+PEER_POOL = PeerConnectionPool()
+
+
+def fetch_peer_metrics(node, deadline):
+    """Fetch /api/metrics from a remote node, returning (metrics, response_time_ms)"""
+    start_time = time.monotonic()
+    status, body = PEER_POOL.request(node.get('ip'), node.get('port', 8080), '/api/metrics',
+                                     peer_timeout(deadline, 3))
+    if status != 200:
+        raise RuntimeError(f'HTTP {status}')
+    metrics = json.loads(body.decode())
+    return metrics, int((time.monotonic() - start_time) * 1000)
+
+
+def local_node_entry():
+    """Peer-state table entry for this node, built from the sampler snapshot"""
+    try:
+        metrics = get_system_metrics()
+    except Exception:
+        metrics = get_system_metrics_fallback()
+    power_state = metrics.get('power_state', 'normal')
+
+    return {
+        'name': CONFIG['node_name'],
+        'ip': 'localhost',
+        'port': CONFIG['port'],
+        'status': 'power_save' if power_state in ('power_save', 'low_power') else 'online',
+        'response_time': 0,
+        'self': True,
+        'last_seen': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'power_state': power_state,
+        'services': metrics.get('services', {}),
+        'metrics': metrics
+    }
+
+
+def probe_node(node_config, deadline):
+    """Fetch /api/metrics once for one node; a connection failure marks it offline"""
+    node_name = node_config.get('name')
+    node_ip = node_config.get('ip')
+    node_port = node_config.get('port')
+
+    # Reachability, response time and payload all come from this one request
+    start_time = time.monotonic()
+    try:
+        metrics, response_time = fetch_peer_metrics(node_config, deadline)
+        error = None
+    except (OSError, http.client.HTTPException):
+        return {
+            'name': node_name,
+            'ip': node_ip,
+            'port': node_port,
+            'status': 'offline',
+            'error': 'node unreachable',
+            'response_time': -1,
+            'self': False,
+            'last_seen': 'never',
+            'power_state': 'offline',
+            'services': {},
+            'metrics': None
+        }
+    except Exception as e:
+        # Reachable, but the answer was not usable metrics (HTTP error, bad JSON)
+        print(f'Error getting remote metrics from {node_name}: {e}')
+        metrics, response_time, error = None, int((time.monotonic() - start_time) * 1000), str(e)
+
+    node = {
+        'name': node_name,
+        'ip': node_ip,
+        'port': node_port,
+        'status': 'online',
+        'response_time': response_time,
+        'self': False,
+        'last_seen': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'power_state': 'normal',
+        'services': {},
+        'metrics': metrics
+    }
+    if error is not None:
+        node['error'] = error
+    if metrics is not None:
+        node['power_state'] = metrics.get('power_state', 'normal')
+        node['services'] = metrics.get('services', {})
+        if node['power_state'] in ('power_save', 'low_power'):
+            node['status'] = 'power_save'
+
+    return node
+
+
+class PeerCircuitBreaker:
+    """Per-peer circuit breakers so offline nodes cost aggregations no latency.
+
+    After breaker_threshold consecutive failures a peer's circuit opens:
+    aggregations skip it and serve its last known entry marked stale, while
+    a background thread re-probes /api/health with exponential backoff.
+    A successful probe closes the circuit; the backoff only resets once a
+    real fetch succeeds again, so a flapping peer keeps backing off.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.peers = {}
+        self.wakeup = threading.Event()
+        self.prober = None
+
+    def state(self, node_config):
+        """Breaker state for a peer (caller holds the lock)"""
+        key = (node_config.get('ip'), node_config.get('port', 8080))
+        if key not in self.peers:
+            self.peers[key] = {
+                'name': node_config.get('name'), 'open': False, 'failures': 0,
+                'backoff': 0, 'next_probe': 0, 'last_good': None
+            }
+        return self.peers[key]
+
+    def is_open(self, node_config):
+        """True while aggregations should skip this peer"""
+        with self.lock:
+            return self.state(node_config)['open']
+
+    def record_success(self, node_config, entry):
+        """A real fetch reached the peer; remember the entry if it carried metrics"""
+        with self.lock:
+            state = self.state(node_config)
+            state.update(open=False, failures=0)
+            if entry.get('metrics') is not None:
+                state.update(backoff=0, last_good=entry)
+
+    def record_failure(self, node_config):
+        """Count a failed fetch, opening the circuit at the threshold"""
+        with self.lock:
+            state = self.state(node_config)
+            state['failures'] += 1
+            if state['open'] or state['failures'] < CONFIG.get('breaker_threshold', 2):
+                return
+            base = CONFIG.get('breaker_backoff', 2)
+            state['backoff'] = min(CONFIG.get('breaker_backoff_max', 60), state['backoff'] * 2 or base)
+            state['next_probe'] = time.monotonic() + state['backoff']
+            state['open'] = True
+            if self.prober is None:
+                self.prober = threading.Thread(target=self.run, name='magi-breaker', daemon=True)
+                self.prober.start()
+        self.wakeup.set()
+
+    def stale_entry(self, node_config):
+        """Last known entry for a peer behind an open circuit, marked stale"""
+        with self.lock:
+            state = self.state(node_config)
+            retry_in = max(0, int(state['next_probe'] - time.monotonic()))
+            last_good = state['last_good']
+
+        entry = dict(last_good) if last_good is not None else {
+            'name': node_config.get('name'),
+            'ip': node_config.get('ip'),
+            'port': node_config.get('port'),
+            'self': False,
+            'last_seen': 'never',
+            'services': {},
+            'metrics': None
+        }
+        entry.update({
+            'status': 'offline',
+            'power_state': 'offline',
+            'response_time': -1,
+            'stale': True,
+            'error': f'node unreachable, next probe in {retry_in}s'
+        })
+        return entry
+
+    def run(self):
+        """Background prober: re-check open peers when their backoff expires"""
+        while True:
+            with self.lock:
+                open_peers = [(key, state) for key, state in self.peers.items() if state['open']]
+                if not open_peers:
+                    self.prober = None
+                    return
+                now = time.monotonic()
+                due = [key for key, state in open_peers if state['next_probe'] <= now]
+                wait = min(state['next_probe'] for _, state in open_peers) - now
+
+            if not due:
+                self.wakeup.wait(max(0.05, wait))
+                self.wakeup.clear()
+                continue
+            for key in due:
+                self.probe(key)
+
+    def probe(self, key):
+        """Probe one open peer's /api/health and close or back off its circuit"""
+        try:
+            # Any HTTP answer means the node is back, even an older build without /api/health
+            PEER_POOL.request(key[0], key[1], '/api/health', CONFIG.get('breaker_probe_timeout', 2))
+            alive = True
+        except Exception:
+            alive = False
+
+        with self.lock:
+            state = self.peers[key]
+            if alive:
+                state.update(open=False, failures=0)
+            else:
+                state['backoff'] = min(CONFIG.get('breaker_backoff_max', 60), state['backoff'] * 2)
+                state['next_probe'] = time.monotonic() + state['backoff']
+
+    def stats(self):
+        """Breaker state per peer"""
+        now = time.monotonic()
+        with self.lock:
+            return {
+                f"{key[0]}:{key[1]}": {
+                    'name': state['name'],
+                    'open': state['open'],
+                    'failures': state['failures'],
+                    'backoff': state['backoff'],
+                    'next_probe_in': round(max(0, state['next_probe'] - now), 1) if state['open'] else None
+                }
+                for key, state in self.peers.items()
+            }
+
+
+PEER_BREAKER = PeerCircuitBreaker()
+
+
+def collect_cluster_state(deadline=None):
+    """Collect every node's state exactly once for one aggregation cycle.
+
+    Returns the peer-state table: the local entry plus one entry per
+    configured node (in configuration order). discover_nodes() and
+    gather_all_metrics() are both views over this table, so neither the
+    local snapshot nor any peer's /api/metrics is fetched twice. Peers
+    behind an open circuit breaker are not contacted at all.
+    """
+    if deadline is None:
+        deadline = aggregation_deadline()
+
+    local = local_node_entry()
+    nodes = []
+    remote_nodes = []
+
+    for node_config in CONFIG.get('other_nodes', []):
+        if node_config.get('name') == local['name']:
+            nodes.append(local)
+            continue
+        if PEER_BREAKER.is_open(node_config):
+            nodes.append(PEER_BREAKER.stale_entry(node_config))
+            continue
+        # Placeholder keeps the configured node order, filled in after the concurrent probe
+        nodes.append(None)
+        remote_nodes.append((len(nodes) - 1, node_config))
+
+    probes = run_peer_tasks(probe_node, [node_config for _, node_config in remote_nodes], deadline)
+    for (index, node_config), (node, error) in zip(remote_nodes, probes):
+        if error is None:
+            nodes[index] = node
+            if node['status'] == 'offline':
+                PEER_BREAKER.record_failure(node_config)
+            else:
+                PEER_BREAKER.record_success(node_config, node)
+            continue
+        PEER_BREAKER.record_failure(node_config)
+        timed_out = isinstance(error, TimeoutError)
+        nodes[index] = {
+            'name': node_config.get('name'),
+            'ip': node_config.get('ip'),
+            'port': node_config.get('port'),
+            'status': 'offline' if timed_out else 'error',
+            'error': str(error),
+            'response_time': -1,
+            'self': False,
+            'last_seen': 'never',
+            'power_state': 'offline' if timed_out else 'error',
+            'services': {},
+            'metrics': None
+        }
 
-        for service_name, service_def in service_definitions.items():
-            process_found = False
-            for proc_name, cmdline in running_processes:
-                if any(proc in proc_name or proc in cmdline for proc in service_def['processes']):
-                    process_found = True
-                    break
+    return {'local': local, 'nodes': nodes}
 
-            port_found = any(port in open_ports for port in service_def['ports'])
-            active_ports = [port for port in service_def['ports'] if port in open_ports]
 
-            if process_found or port_found:
-                services[service_name] = {
-                    'status': 'running' if process_found else 'port_open',
-                    'ports': active_ports if active_ports else service_def['ports'][:1],
-                    'description': service_def['description'],
-                    'process_detected': process_found,
-                    'port_detected': port_found
-                }
+class ClusterStateCache:
+    """Shared cluster snapshot with a TTL and single-flight refresh.
 
-        additional_ports = {21: 'FTP', 25: 'SMTP', 53: 'DNS', 110: 'POP3', 143: 'IMAP', 993: 'IMAPS', 995: 'POP3S', 3389: 'RDP', 5432: 'PostgreSQL', 6379: 'Redis', 27017: 'MongoDB', 9200: 'Elasticsearch'}
-        for port, svc in additional_ports.items():
-            if port in open_ports and svc.lower() not in services:
-                services[svc.lower()] = {
-                    'status': 'port_open',
-                    'ports': [port],
-                    'description': svc,
-                    'process_detected': False,
-                    'port_detected': True
-                }
-    except Exception as e:
-        print(f"Error detecting services: {e}")
+    Callers that find the snapshot older than cluster_cache_ttl either start
+    the one refresh or wait for the refresh already in flight, so concurrent
+    dashboards, polls and the stream producer aggregate the cluster once.
+    Only the refresh takes an "aggregate" admission slot; when none is free
+    the leader and its waiters get AdmissionRejected.
+    """
 
-    return services
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.collected_at = 0
+        self.flight = None
 
+    def get(self):
+        """Return a cluster state no older than the TTL, refreshing it at most once at a time"""
+        with self.lock:
+            if self.state is not None and time.monotonic() - self.collected_at < CONFIG.get('cluster_cache_ttl', 2):
+                return self.state
+            flight = self.flight
+            leader = flight is None
+            if leader:
+                flight = self.flight = {'done': threading.Event(), 'state': None, 'error': None, 'rejected': False}
 
-def get_service_port(service_name):
-    """Get default port for common services"""
-    default_ports = {
-        'nextcloud': 80,
-        'jellyfin': 8096,
-        'plex': 32400,
-        'ssh': 22,
-        'web': 80,
-        'samba': 445
-    }
-    return default_ports.get(service_name)
+        if not leader:
+            flight['done'].wait()
+            if flight['rejected']:
+                raise AdmissionRejected('aggregate')
+            if flight['error'] is not None:
+                # A fresh exception per waiter; the leader's traceback stays in the leader's thread
+                raise RuntimeError(f"cluster refresh failed: {flight['error']}")
+            return flight['state']
 
+        started_at = time.monotonic()
+        admitted = ADMISSION.acquire('aggregate')
+        try:
+            if not admitted:
+                flight['rejected'] = True
+                raise AdmissionRejected('aggregate')
+            flight['state'] = collect_cluster_state()
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            flight['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            if admitted:
+                ADMISSION.release('aggregate')
+            with self.lock:
+                if flight['state'] is not None:
+                    self.state = flight['state']
+                    self.collected_at = started_at
+                self.flight = None
+            flight['done'].set()
+        return flight['state']
 
-def get_system_metrics_fallback():
-    """Fallback system metrics without psutil"""
-    return {
-        'cpu': 42,
-        'memory': {'percentage': 35, 'used_gb': 2.8, 'total_gb': 8.0},
-        'disk': {'percentage': 60, 'used_gb': 120, 'total_gb': 200},
-        'network': {'mb_sent': 45.2, 'mb_recv': 234.5},
-        'temperature': {'cpu': {'current': 45}},
-        'power_state': 'normal',
-        'services': {},
-        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-        'node_status': 'online'
-    }
+
+CLUSTER_STATE = ClusterStateCache()
 
 
-def gather_all_metrics():
+def gather_all_metrics(state=None):
     """Collect metrics for local node and attempt to retrieve from other configured nodes."""
-    all_metrics = {}
+    demo_mode = os.environ.get('MAGI_DEMO_MODE', 'false').lower() == 'true'
+    if state is None:
+        state = {'local': local_node_entry(), 'nodes': []} if demo_mode else CLUSTER_STATE.get()
 
-    # Local metrics
-    try:
-        local_metrics = get_system_metrics()
-        all_metrics[CONFIG['node_name']] = {
-            'status': 'online',
-            'metrics': local_metrics,
-            'ip': 'localhost',
-            'port': CONFIG['port']
-        }
-    except Exception:
-        all_metrics[CONFIG['node_name']] = {
+    local = state['local']
+    all_metrics = {
+        local['name']: {
             'status': 'online',
-            'metrics': get_system_metrics_fallback(),
+            'metrics': local['metrics'],
             'ip': 'localhost',
-            'port': CONFIG['port']
+            'port': local['port'],
+            'response_time': 0
         }
+    }
 
-    demo_mode = os.environ.get('MAGI_DEMO_MODE', 'false').lower() == 'true'
     if demo_mode:
         # Simulate other nodes
         for i, node_name in enumerate(['GASPAR', 'MELCHIOR', 'BALTASAR']):
@@ -2339,154 +5194,370 @@ def gather_all_metrics():
             }
         return all_metrics
 
-    # Real discovery
-    nodes = discover_nodes()
-    for node in nodes:
-        name = node.get('name')
-        if name == CONFIG['node_name']:
+    for node in state['nodes']:
+        if node['self']:
             continue
 
-        if node.get('status') not in ('online', 'power_save'):
-            all_metrics[name] = {
-                'status': node.get('status'),
-                'error': 'node unreachable',
+        if node.get('metrics') is not None:
+            all_metrics[node['name']] = {
+                'status': 'online',
+                'metrics': node['metrics'],
                 'ip': node.get('ip'),
-                'port': node.get('port', 'unknown')
+                'port': node.get('port', 8080),
+                'response_time': node.get('response_time', -1)
             }
-            continue
-
-        node_ip = node.get('ip')
-        node_port = node.get('port', 8080)
-
-        try:
-            url = f'http://{node_ip}:{node_port}/api/metrics'
-            req = urllib.request.Request(url, headers={'User-Agent': 'MAGI-Discovery'})
-            with urllib.request.urlopen(req, timeout=3) as resp:
-                if resp.status == 200:
-                    metrics = json.loads(resp.read().decode())
-                    all_metrics[name] = {
-                        'status': 'online',
-                        'metrics': metrics,
-                        'ip': node_ip,
-                        'port': node_port
-                    }
-                else:
-                    all_metrics[name] = {
-                        'status': 'error',
-                        'error': f'HTTP {resp.status}',
-                        'ip': node_ip,
-                        'port': node_port
-                    }
-        except Exception as e:
-            all_metrics[name] = {
-                'status': 'offline',
-                'error': str(e),
-                'ip': node_ip,
-                'port': node_port
+            if node.get('stale'):
+                # Last known metrics of a peer behind an open circuit breaker
+                all_metrics[node['name']].update({
+                    'status': node['status'],
+                    'stale': True,
+                    'error': node.get('error'),
+                    'last_seen': node.get('last_seen')
+                })
+        else:
+            # Reachable nodes whose metrics could not be fetched are reported as errors
+            reachable = node.get('status') in ('online', 'power_save')
+            all_metrics[node['name']] = {
+                'status': 'error' if reachable else node.get('status'),
+                'error': node.get('error', 'node unreachable'),
+                'ip': node.get('ip'),
+                'port': node.get('port', 'unknown'),
+                'response_time': node.get('response_time', -1)
             }
 
     return all_metrics
 
 
-def discover_nodes():
+def discover_nodes(state=None):
     """Discover other MAGI nodes on the network with power state detection and services"""
-    nodes = []
-    current_node = CONFIG.get('node_name')
-    current_port = CONFIG.get('port')
+    if state is None:
+        state = CLUSTER_STATE.get()
+    return [{key: value for key, value in node.items() if key != 'metrics'} for node in state['nodes']]
 
-    for node_config in CONFIG.get('other_nodes', []):
-        node_name = node_config.get('name')
-        node_ip = node_config.get('ip')
-        node_port = node_config.get('port')
 
-        # Self case
-        if node_name == current_node:
-            try:
-                metrics = get_system_metrics()
-                power_state = metrics.get('power_state', 'normal')
-                node_status = 'power_save' if power_state in ('power_save', 'low_power') else 'online'
-                services = metrics.get('services', {})
-            except Exception:
-                node_status = 'online'
-                power_state = 'normal'
-                services = {}
-
-            nodes.append({
-                'name': node_name,
-                'ip': 'localhost',
-                'port': current_port,
-                'status': node_status,
-                'response_time': 0,
-                'self': True,
-                'last_seen': time.strftime('%Y-%m-%d %H:%M:%S'),
-                'power_state': power_state,
-                'services': services
-            })
-            continue
+def gather_all_services(state=None):
+    """Build the service@node map for every discovered node"""
+    if state is None:
+        state = CLUSTER_STATE.get()
+    all_services = {}
 
-        # Test remote connectivity and try to fetch /api/metrics
-        try:
-            start_time = time.time()
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(2)
-            result = sock.connect_ex((node_ip, node_port))
-            sock.close()
-            response_time = int((time.time() - start_time) * 1000)
-
-            if result == 0:
-                node_status = 'online'
-                power_state = 'normal'
-                services = {}
-                try:
-                    url = f'http://{node_ip}:{node_port}/api/metrics'
-                    req = urllib.request.Request(url, headers={'User-Agent': 'MAGI-Discovery'})
-                    with urllib.request.urlopen(req, timeout=2) as response:
-                        if response.status == 200:
-                            metrics_data = json.loads(response.read().decode())
-                            power_state = metrics_data.get('power_state', 'normal')
-                            services = metrics_data.get('services', {})
-                            if power_state in ('power_save', 'low_power'):
-                                node_status = 'power_save'
-                except Exception as e:
-                    print(f'Error getting remote metrics from {node_name}: {e}')
-
-                nodes.append({
-                    'name': node_name,
-                    'ip': node_ip,
-                    'port': node_port,
-                    'status': node_status,
-                    'response_time': response_time,
-                    'self': False,
-                    'last_seen': time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'power_state': power_state,
-                    'services': services
-                })
+    for node in discover_nodes(state):
+        node_name = node["name"]
+        node_services = node.get("services", {})
+
+        # Añadir información del nodo a cada servicio
+        for service_name, service_info in node_services.items():
+            service_key = f"{service_name}@{node_name}"
+            all_services[service_key] = {
+                **service_info,
+                "node": node_name,
+                "node_ip": node["ip"],
+                "node_status": node["status"]
+            }
+
+    return all_services
+
+
+def diff_snapshot(old, new):
+    """Return (patch, removed) turning old into new, or (None, None) if new must be sent whole.
+
+    Dicts, and lists whose length did not change, are diffed recursively
+    (list positions become string keys); any other changed value is replaced
+    in the patch. removed lists the key paths to delete before applying it.
+    """
+    removed = []
+
+    def as_mapping(value, other):
+        if isinstance(value, dict) and isinstance(other, dict):
+            return value
+        if isinstance(value, list) and isinstance(other, list) and len(value) == len(other):
+            return {str(index): item for index, item in enumerate(value)}
+        return None
+
+    def diff(old_value, new_value, path):
+        old_items = as_mapping(old_value, new_value)
+        new_items = as_mapping(new_value, old_value)
+        if old_items is None:
+            return None
+
+        patch = {}
+        for key, value in new_items.items():
+            if key not in old_items:
+                patch[key] = value
+                continue
+            sub_patch = diff(old_items[key], value, path + [key])
+            if sub_patch is None:
+                if value != old_items[key]:
+                    patch[key] = value
+                    # A dict replacing a list would be merged into it, so drop the list first
+                    if isinstance(value, dict) and isinstance(old_items[key], list):
+                        removed.append(path + [key])
+            elif sub_patch:
+                patch[key] = sub_patch
+        for key in old_items:
+            if key not in new_items:
+                removed.append(path + [key])
+        return patch
+
+    patch = diff(old, new, [])
+    if patch is None:
+        return None, None
+    return patch, removed
+
+
+class DeltaEncoder:
+    """Keyframe/patch encoding of successive snapshots of one polled payload.
+
+    The last few versions are kept so a client that last saw version `since`
+    only gets the changed fields. Clients delta_keyframe_interval or more
+    versions behind, or behind the kept history, get the full snapshot as a
+    keyframe instead. Volatile top-level fields (stamped at read time) are
+    left out of the versioned snapshot and sent in the envelope; when `key`
+    names a field, a new version is made only when that field changes.
+    """
+
+    HISTORY = 16
+
+    def __init__(self, volatile=(), key=None):
+        self.volatile = volatile
+        self.key = key
+        self.snapshots = collections.OrderedDict()
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def split(self, snapshot):
+        """(versioned snapshot, volatile fields) of a snapshot"""
+        extra = {name: snapshot[name] for name in self.volatile if name in snapshot}
+        if extra:
+            snapshot = {name: value for name, value in snapshot.items() if name not in extra}
+        return snapshot, extra
+
+    def update(self, snapshot):
+        """Record a versioned snapshot, returning its version (unchanged snapshots keep the current one)"""
+        with self.lock:
+            current = self.snapshots.get(self.version)
+            if current is not None:
+                if self.key is not None and self.key in snapshot:
+                    if current.get(self.key) == snapshot[self.key]:
+                        return self.version
+                elif current == snapshot:
+                    return self.version
+            self.version += 1
+            self.snapshots[self.version] = snapshot
+            while len(self.snapshots) > self.HISTORY:
+                self.snapshots.popitem(last=False)
+            return self.version
+
+    def encode(self, since=None, extra=None):
+        """Encode the current snapshot relative to the version a client already has"""
+        with self.lock:
+            version = self.version
+            snapshot = self.snapshots[version]
+            base = None
+            if since is not None and 0 <= version - since < CONFIG.get('delta_keyframe_interval', 12):
+                base = self.snapshots.get(since)
+
+        envelope = None
+        if base is not None:
+            patch, removed = diff_snapshot(base, snapshot)
+            if patch is not None:
+                envelope = {'type': 'patch', 'version': version, 'since': since, 'patch': patch, 'removed': removed}
+        if envelope is None:
+            envelope = {'type': 'keyframe', 'version': version, 'data': snapshot}
+        if extra:
+            envelope.update(extra)
+        return envelope
+
+
+# sample_age is stamped on every read; a new version only comes with a new sample
+METRICS_DELTA = DeltaEncoder(volatile=('sample_age',), key='sampled_at')
+ALL_METRICS_DELTA = DeltaEncoder()
+
+
+class StreamEvent:
+    """One published SSE event, pre-encoded once for full and delta subscribers"""
+
+    def __init__(self, instance, sequence, channel, event_name, data, previous, keyframe):
+        self.sequence = sequence
+        self.id = f"{instance}-{sequence}"
+        self.channel = channel
+        data_json = json.dumps(data, separators=(',', ':'))
+        keyframe_json = '{"type":"keyframe","data":' + data_json + '}'
+
+        patch_json = None
+        if not keyframe and previous is not None:
+            patch, removed = diff_snapshot(previous, data)
+            if patch is not None:
+                patch_json = json.dumps({'type': 'patch', 'patch': patch, 'removed': removed}, separators=(',', ':'))
+
+        self.full = self.format(event_name, data_json)
+        self.keyframe = self.format(event_name, keyframe_json)
+        self.patch = self.format(event_name, patch_json) if patch_json is not None else None
+
+    def format(self, event_name, data_json):
+        """Serialize as an SSE frame"""
+        lines = [f"id: {self.id}"]
+        if event_name:
+            lines.append(f"event: {event_name}")
+        lines.append(f"data: {data_json}")
+        return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class StreamSubscriber:
+    """Bounded event queue for one /api/stream client"""
+
+    def __init__(self, max_pending, delta=False, needs_keyframe=()):
+        self.pending = collections.deque()
+        self.max_pending = max_pending
+        self.delta = delta
+        # Delta channels whose patch chain is broken and must restart with a keyframe
+        self.needs_keyframe = set(needs_keyframe)
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def push(self, event):
+        """Queue an event, dropping the oldest one if the client is not keeping up"""
+        with self.condition:
+            if len(self.pending) >= self.max_pending:
+                dropped = self.pending.popleft()
+                self.needs_keyframe.add(dropped.channel)
+                self.dropped += 1
+            self.pending.append(event)
+            self.condition.notify()
+
+    def wait(self, timeout):
+        """Return encoded frames for all queued events, waiting up to timeout seconds for one"""
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(timeout)
+            events = list(self.pending)
+            self.pending.clear()
+
+            frames = []
+            for event in events:
+                if not self.delta:
+                    frames.append(event.full)
+                elif event.patch is None or event.channel in self.needs_keyframe:
+                    self.needs_keyframe.discard(event.channel)
+                    frames.append(event.keyframe)
+                else:
+                    frames.append(event.patch)
+            return frames
+
+
+class ClusterBroadcaster:
+    """Single producer that aggregates the cluster once per cycle for every stream client.
+
+    Each cycle publishes the all-metrics snapshot as the default SSE message
+    plus 'nodes' and 'services' events, all serialized once and shared by
+    every subscriber. Delta subscribers (?delta=1) get the same events as
+    keyframe/patch envelopes, with a full keyframe every
+    delta_keyframe_interval cycles. Recent events are kept for Last-Event-ID
+    resume. The producer thread only runs while there are subscribers.
+    """
+
+    RETRY_MS = 3000
+    REPLAY_EVENTS = 30  # recent events kept for Last-Event-ID resume
+    MAX_PENDING = 6  # per-client queue bound, about two cycles
+    CHANNELS = ('metrics', 'nodes', 'services')
+
+    def __init__(self):
+        self.subscribers = set()
+        self.events = collections.deque(maxlen=self.REPLAY_EVENTS)
+        self.latest_cycle = []
+        self.previous = {}
+        self.cycles = 0
+        self.next_id = 1
+        # Event ids carry a per-process prefix so ids from before a restart never resume
+        self.instance = format(int(time.time()), 'x')
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def parse_event_id(self, last_event_id):
+        """Return the sequence number of a Last-Event-ID issued by this process, or None"""
+        if not last_event_id:
+            return None
+        instance, _, sequence = last_event_id.partition('-')
+        if instance != self.instance or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def subscribe(self, last_event_id=None, delta=False, factory=StreamSubscriber):
+        """Register a client, queueing missed events (or the latest cycle) right away"""
+        with self.lock:
+            last_sequence = self.parse_event_id(last_event_id)
+            resumable = (
+                last_sequence is not None and last_sequence < self.next_id
+                and (not self.events or self.events[0].sequence <= last_sequence + 1)
+            )
+            if resumable:
+                backlog = [event for event in self.events if event.sequence > last_sequence]
+                subscriber = factory(self.MAX_PENDING, delta)
             else:
-                nodes.append({
-                    'name': node_name,
-                    'ip': node_ip,
-                    'port': node_port,
-                    'status': 'offline',
-                    'response_time': -1,
-                    'self': False,
-                    'last_seen': 'never',
-                    'power_state': 'offline',
-                    'services': {}
-                })
-        except Exception as e:
-            nodes.append({
-                'name': node_name,
-                'ip': node_ip,
-                'port': node_port,
-                'status': 'error',
-                'response_time': -1,
-                'self': False,
-                'last_seen': 'never',
-                'power_state': 'error',
-                'services': {}
-            })
+                backlog = list(self.latest_cycle)
+                subscriber = factory(self.MAX_PENDING, delta, self.CHANNELS)
+            for event in backlog:
+                subscriber.push(event)
+
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='magi-stream', daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a client; the producer stops after its last client leaves"""
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish_cycle(self):
+        """Aggregate the cluster once and broadcast it to all subscribers"""
+        state = CLUSTER_STATE.get()
+        payloads = [
+            ('metrics', None, gather_all_metrics(state)),
+            ('nodes', 'nodes', discover_nodes(state)),
+            ('services', 'services', gather_all_services(state))
+        ]
+
+        with self.lock:
+            keyframe = self.cycles % CONFIG.get('delta_keyframe_interval', 12) == 0
+            self.cycles += 1
 
-    return nodes
+            cycle = []
+            for channel, event_name, data in payloads:
+                event = StreamEvent(self.instance, self.next_id, channel, event_name,
+                                    data, self.previous.get(channel), keyframe)
+                self.next_id += 1
+                self.previous[channel] = data
+                cycle.append(event)
+
+            self.events.extend(cycle)
+            self.latest_cycle = cycle
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            for event in cycle:
+                subscriber.push(event)
+
+    def run(self):
+        """Producer loop, one aggregation per stream_interval while clients are connected"""
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    # The next subscriber starts a fresh patch chain
+                    self.previous = {}
+                    return
+
+            started = time.monotonic()
+            try:
+                self.publish_cycle()
+            except Exception as e:
+                print(f"SSE stream error: {e}")
+            time.sleep(max(0, CONFIG.get('stream_interval', 5) - (time.monotonic() - started)))
+
+
+CLUSTER_BROADCASTER = ClusterBroadcaster()
 
 
 def ensure_api_key():
@@ -2537,6 +5608,133 @@ def setup_node():
     if env_require_login is not None:
         CONFIG['require_login'] = str(env_require_login).lower() in ('1', 'true', 'yes')
     
+    # Background sampler cadence
+    try:
+        env_sample_interval = os.environ.get('MAGI_SAMPLE_INTERVAL')
+        if env_sample_interval:
+            CONFIG['sample_interval'] = max(0.5, float(env_sample_interval))
+    except Exception:
+        pass
+
+    # Peer fan-out deadline
+    try:
+        env_aggregation_timeout = os.environ.get('MAGI_AGGREGATION_TIMEOUT')
+        if env_aggregation_timeout:
+            CONFIG['aggregation_timeout'] = max(0.5, float(env_aggregation_timeout))
+    except Exception:
+        pass
+
+    # Service detection port scan cadence
+    try:
+        env_port_scan_interval = os.environ.get('MAGI_PORT_SCAN_INTERVAL')
+        if env_port_scan_interval:
+            CONFIG['port_scan_interval'] = max(1, float(env_port_scan_interval))
+    except Exception:
+        pass
+
+    # SSE stream cadence
+    try:
+        env_stream_interval = os.environ.get('MAGI_STREAM_INTERVAL')
+        if env_stream_interval:
+            CONFIG['stream_interval'] = max(1, float(env_stream_interval))
+    except Exception:
+        pass
+
+    # Worker pool and admission control
+    try:
+        env_workers = os.environ.get('MAGI_WORKER_THREADS')
+        if env_workers:
+            CONFIG['worker_threads'] = max(1, int(env_workers))
+        env_accept_queue = os.environ.get('MAGI_ACCEPT_QUEUE')
+        if env_accept_queue:
+            CONFIG['accept_queue'] = max(1, int(env_accept_queue))
+    except Exception:
+        pass
+
+    try:
+        env_table_interval = os.environ.get('MAGI_PROCESS_TABLE_INTERVAL')
+        if env_table_interval:
+            CONFIG['process_table_interval'] = max(1, float(env_table_interval))
+    except Exception:
+        pass
+
+    env_fast_path = os.environ.get('MAGI_PROC_FAST_PATH')
+    if env_fast_path:
+        CONFIG['proc_fast_path'] = env_fast_path.lower() in ('1', 'true', 'yes')
+
+    env_network_exclude = os.environ.get('MAGI_NETWORK_EXCLUDE')
+    if env_network_exclude is not None:
+        CONFIG['network_exclude'] = [name.strip() for name in env_network_exclude.split(',') if name.strip()]
+
+    env_disk_include = os.environ.get('MAGI_DISK_INCLUDE')
+    if env_disk_include is not None:
+        CONFIG['disk_include'] = [name.strip() for name in env_disk_include.split(',') if name.strip()]
+    env_disk_exclude = os.environ.get('MAGI_DISK_EXCLUDE')
+    if env_disk_exclude is not None:
+        CONFIG['disk_exclude'] = [name.strip() for name in env_disk_exclude.split(',') if name.strip()]
+
+    # Metric history storage; an empty MAGI_HISTORY_DIR keeps history in memory only
+    env_history_dir = os.environ.get('MAGI_HISTORY_DIR')
+    if env_history_dir is not None:
+        CONFIG['history_dir'] = env_history_dir or None
+    try:
+        env_history_max = os.environ.get('MAGI_HISTORY_MAX_MB')
+        if env_history_max:
+            CONFIG['history_max_mb'] = max(1, float(env_history_max))
+    except Exception:
+        pass
+
+    # Peer circuit breaker
+    try:
+        env_breaker_threshold = os.environ.get('MAGI_BREAKER_THRESHOLD')
+        if env_breaker_threshold:
+            CONFIG['breaker_threshold'] = max(1, int(env_breaker_threshold))
+        env_breaker_backoff = os.environ.get('MAGI_BREAKER_BACKOFF')
+        if env_breaker_backoff:
+            CONFIG['breaker_backoff'] = max(0.1, float(env_breaker_backoff))
+        env_breaker_backoff_max = os.environ.get('MAGI_BREAKER_BACKOFF_MAX')
+        if env_breaker_backoff_max:
+            CONFIG['breaker_backoff_max'] = max(1, float(env_breaker_backoff_max))
+        env_breaker_probe_timeout = os.environ.get('MAGI_BREAKER_PROBE_TIMEOUT')
+        if env_breaker_probe_timeout:
+            CONFIG['breaker_probe_timeout'] = max(0.1, float(env_breaker_probe_timeout))
+    except Exception:
+        pass
+
+    try:
+        env_cluster_ttl = os.environ.get('MAGI_CLUSTER_CACHE_TTL')
+        if env_cluster_ttl:
+            CONFIG['cluster_cache_ttl'] = max(0, float(env_cluster_ttl))
+    except Exception:
+        pass
+
+    try:
+        env_keepalive = os.environ.get('MAGI_KEEPALIVE_TIMEOUT')
+        if env_keepalive:
+            CONFIG['keepalive_timeout'] = max(1, float(env_keepalive))
+    except Exception:
+        pass
+
+    # e.g. MAGI_ENDPOINT_LIMITS="read=12,aggregate=4,control=2,stream=4"
+    try:
+        env_limits = os.environ.get('MAGI_ENDPOINT_LIMITS')
+        if env_limits:
+            limits = dict(CONFIG['endpoint_limits'])
+            for item in env_limits.split(','):
+                name, _, value = item.partition('=')
+                if name.strip() in limits:
+                    limits[name.strip()] = max(1, int(value))
+            CONFIG['endpoint_limits'] = limits
+    except Exception:
+        pass
+
+    env_server_mode = os.environ.get('MAGI_SERVER_MODE')
+    if env_server_mode:
+        if env_server_mode.lower() in ('threaded', 'asyncio'):
+            CONFIG['server_mode'] = env_server_mode.lower()
+        else:
+            print(f"⚠️  WARNING: Unknown MAGI_SERVER_MODE '{env_server_mode}', using {CONFIG['server_mode']}")
+
     env_admin_pass = os.environ.get('MAGI_ADMIN_PASSWORD')
     if env_admin_pass:
         CONFIG['login_users']['admin'] = env_admin_pass
@@ -2550,8 +5748,330 @@ def setup_node():
         print(f"  bind_address={CONFIG.get('bind_address')} port={CONFIG.get('port')} require_api_key={CONFIG.get('require_api_key')} require_login={CONFIG.get('require_login')}")
 
 
+def run_benchmarks():
+    """Run the built-in micro benchmarks (python3 magi-node-v2.py --benchmark)"""
+    print('⏱️  Service matcher')
+    benchmark_service_matcher()
+    print('⏱️  Host collectors (/proc fast path vs psutil)')
+    benchmark_host_collectors()
+
+
+# Endpoint class per GET path; anything not listed is a cheap "read". The cluster
+# endpoints are reads too: only the ClusterStateCache refresh takes an "aggregate" slot.
+GET_ENDPOINT_CLASSES = {
+    '/api/stream': 'stream',
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when work needs a slot in an endpoint class that is at its limit"""
+
+    def __init__(self, endpoint_class):
+        super().__init__(f"Too many concurrent {endpoint_class} requests")
+        self.endpoint_class = endpoint_class
+
+
+class AdmissionControl:
+    """Concurrency limits per endpoint class; requests over a limit are refused, never queued"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = collections.Counter()
+        self.rejected = collections.Counter()
+
+    def acquire(self, endpoint_class):
+        """Take a slot for endpoint_class, or return False if it is full"""
+        limit = CONFIG.get('endpoint_limits', {}).get(endpoint_class)
+        with self.lock:
+            if limit is not None and self.active[endpoint_class] >= limit:
+                self.rejected[endpoint_class] += 1
+                return False
+            self.active[endpoint_class] += 1
+            return True
+
+    def release(self, endpoint_class):
+        """Return a slot taken by acquire()"""
+        with self.lock:
+            self.active[endpoint_class] -= 1
+
+    def stats(self):
+        """Active and rejected request counts per endpoint class"""
+        with self.lock:
+            return {
+                name: {"active": self.active[name], "limit": limit, "rejected": self.rejected[name]}
+                for name, limit in CONFIG.get('endpoint_limits', {}).items()
+            }
+
+
+ADMISSION = AdmissionControl()
+
+
+class MAGIServer(socketserver.TCPServer):
+    """HTTP server with a fixed worker pool fed by a bounded accept queue.
+
+    The thread count never grows with load: once the queue is full new
+    connections get an immediate 503 from the accept loop. Workers are
+    daemons so open SSE streams don't block shutdown.
+    """
+
+    OVERLOAD_RESPONSE = (
+        b"HTTP/1.0 503 Service Unavailable\r\n"
+        b"Content-Type: text/plain\r\n"
+        b"Content-Length: 12\r\n"
+        b"Connection: close\r\n"
+        b"Retry-After: %d\r\n\r\n"
+        b"Server busy\n"
+    )
+
+    def __init__(self, server_address, handler_class):
+        self.pending = queue.Queue(max(1, CONFIG.get('accept_queue', 64)))
+        super().__init__(server_address, handler_class)
+        self.workers = []
+        for i in range(max(1, CONFIG.get('worker_threads', 16))):
+            worker = threading.Thread(target=self.work, name=f'magi-worker-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def process_request(self, request, client_address):
+        """Queue an accepted connection for the pool, or turn it away if the queue is full"""
+        try:
+            self.pending.put_nowait((request, client_address))
+        except queue.Full:
+            self.reject(request)
+
+    def work(self):
+        """Worker loop: serve queued connections one at a time"""
+        while True:
+            request, client_address = self.pending.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def reject(self, request):
+        """Answer 503 without reading the request and close the connection"""
+        try:
+            request.settimeout(1)
+            request.sendall(self.OVERLOAD_RESPONSE % CONFIG.get('retry_after', 2))
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+
+class BufferedMAGIHandler(MAGIHandler):
+    """MAGIHandler replaying one request from memory and buffering its response"""
+
+    def __init__(self, request, client_address, server):
+        # BaseRequestHandler.__init__ would serve a socket, so it is deliberately not called
+        self.rfile = io.BytesIO(request)
+        self.wfile = io.BytesIO()
+        self.client_address = client_address
+        self.server = server
+        self.connection = None
+        self.close_connection = True
+        self.directory = os.getcwd()
+        self.body_file = None
+
+    def prepare(self):
+        """Parse the request line and headers; False if an error response was buffered instead"""
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return False
+        if not self.raw_requestline:
+            return False
+        return self.parse_request()
+
+    def dispatch(self):
+        """Run the method handler for the parsed request and return the buffered response"""
+        method = getattr(self, 'do_' + self.command, None)
+        if method is None:
+            self.send_error(501, f"Unsupported method ({self.command!r})")
+        else:
+            try:
+                method()
+            except Exception as e:
+                print(f"Error handling {self.command} {self.path}: {e}")
+                if not self.wfile.getvalue():
+                    self.send_error(500, "Internal server error")
+        return self.take_output()
+
+    def write_file(self, f, size):
+        """Hand the file to the event loop, which streams it with loop.sendfile after the headers"""
+        self.body_file = (os.fdopen(os.dup(f.fileno()), 'rb'), size)
+
+    def take_output(self):
+        """Return and clear the buffered response bytes"""
+        data = self.wfile.getvalue()
+        self.wfile.seek(0)
+        self.wfile.truncate()
+        return data
+
+
+class AsyncStreamSubscriber(StreamSubscriber):
+    """Stream subscriber that wakes an asyncio task instead of a blocked thread"""
+
+    def __init__(self, loop, max_pending, delta=False, needs_keyframe=()):
+        super().__init__(max_pending, delta, needs_keyframe)
+        self.loop = loop
+        self.ready = asyncio.Event()
+
+    def push(self, event):
+        """Queue an event and wake the stream coroutine (called from the producer thread)"""
+        super().push(event)
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+
+    async def wait_async(self, timeout):
+        """Return queued frames, waiting up to timeout seconds for at least one"""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.ready.clear()
+        return self.wait(0)
+
+
+class AsyncMAGIServer:
+    """asyncio HTTP front end: open connections and SSE clients are coroutines, not threads.
+
+    Each request is read just far enough to frame it and then replayed
+    through BufferedMAGIHandler on a bounded executor, so every route keeps
+    the exact auth and response behaviour of MAGIHandler and blocking
+    psutil/peer calls never run on the event loop. /api/stream is served
+    directly from the cluster broadcaster.
+    """
+
+    MAX_HEADER_BYTES = 64 * 1024
+    MAX_BODY_BYTES = 1024 * 1024
+    REQUEST_TIMEOUT = 30
+
+    def __init__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=CONFIG.get('async_workers', 16),
+            thread_name_prefix='magi-async'
+        )
+        self.loop = None
+
+    def serve_forever(self, bind, port):
+        """Run the event loop until interrupted"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(
+            self.handle_connection, bind or None, port,
+            limit=self.MAX_HEADER_BYTES, reuse_address=True
+        ))
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+
+    async def read_request(self, reader, timeout):
+        """Read one request head and body, or None when the connection should close"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, OSError):
+            return None
+
+        length = 0
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                try:
+                    length = int(value.strip())
+                except ValueError:
+                    return None
+        if length < 0 or length > self.MAX_BODY_BYTES:
+            return None
+
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), self.REQUEST_TIMEOUT) if length else b''
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, OSError):
+            return None
+        return head + body
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until it closes"""
+        client_address = writer.get_extra_info('peername') or ('', 0)
+        timeout = self.REQUEST_TIMEOUT
+        handler = None
+        try:
+            while True:
+                request = await self.read_request(reader, timeout)
+                if request is None:
+                    break
+
+                handler = BufferedMAGIHandler(request, client_address, self)
+                if not handler.prepare():
+                    writer.write(handler.take_output())
+                    break
+
+                if handler.command == 'GET' and urllib.parse.urlsplit(handler.path).path == '/api/stream':
+                    await self.serve_stream(handler, writer)
+                    break
+
+                response = await self.loop.run_in_executor(self.executor, handler.dispatch)
+                writer.write(response)
+                await writer.drain()
+                if handler.body_file is not None:
+                    body_file, size = handler.body_file
+                    handler.body_file = None
+                    with body_file:
+                        # Zero-copy where the transport allows it, chunked reads otherwise
+                        await self.loop.sendfile(writer.transport, body_file, 0, size)
+                if handler.close_connection:
+                    break
+                timeout = CONFIG.get('keepalive_timeout', 15)
+        except OSError:
+            pass
+        finally:
+            if handler is not None and handler.body_file is not None:
+                handler.body_file[0].close()
+            writer.close()
+
+    async def serve_stream(self, handler, writer):
+        """Serve /api/stream as a coroutine fed by the cluster broadcaster"""
+        path = handler.parse_target()
+        if not handler.authorize_get(path):
+            writer.write(handler.take_output())
+            return
+
+        heartbeat = CONFIG.get('stream_heartbeat', 15)
+        subscriber = CLUSTER_BROADCASTER.subscribe(
+            handler.headers.get('Last-Event-ID'), handler.query_flag('delta'),
+            factory=lambda *args: AsyncStreamSubscriber(self.loop, *args)
+        )
+        try:
+            handler.start_stream()
+            writer.write(handler.take_output())
+            while True:
+                # A client that stops reading for too long is dropped
+                await asyncio.wait_for(writer.drain(), heartbeat * 2)
+                events = await subscriber.wait_async(heartbeat)
+                writer.write(b''.join(events) if events else b': heartbeat\n\n')
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            CLUSTER_BROADCASTER.unsubscribe(subscriber)
+
+
 def main():
     """Main MAGI function"""
+    if '--benchmark' in sys.argv[1:]:
+        run_benchmarks()
+        return
+
     print('⚡ MAGI v2.0 - Enhanced Distributed Monitoring')
     print('=' * 50)
 
@@ -2576,16 +6096,38 @@ def main():
         start_session_cleanup()
         print('🔐 Session management started')
 
+    if CONFIG.get('history_dir'):
+        try:
+            METRIC_HISTORY.open_store(CONFIG['history_dir'])
+            print(f"🗄️  Metric history stored in {CONFIG['history_dir']}")
+        except OSError as e:
+            print(f"⚠️  WARNING: Metric history kept in memory only ({e})")
+
+    # Render dashboard pages and assets once; requests only send the cached bytes
+    assets = get_static_assets()
+    print(f"🎨 Dashboard assets rendered ({sum(len(asset.body) for asset in assets.values()) // 1024} KB)")
+
+    # Start background metrics sampling so requests never block on collection
+    METRICS_SAMPLER.start()
+    print(f"📈 Metrics sampler started (every {CONFIG['sample_interval']}s)")
+
+    def print_banner(mode):
+        bind = CONFIG.get('bind_address') or '0.0.0.0'
+        print(f"🚀 MAGI {CONFIG['node_name']} server started ({mode})")
+        print(f"📡 Access dashboard: http://{bind}:{CONFIG['port']}")
+        if CONFIG.get('require_api_key'):
+            print('🔒 API key enforcement enabled. Use Authorization: Bearer <API_KEY>')
+        print('Press Ctrl+C to stop')
+        print('=' * 50)
+
     try:
-        with socketserver.ThreadingTCPServer((CONFIG.get('bind_address', ''), CONFIG['port']), MAGIHandler) as httpd:
-            bind = CONFIG.get('bind_address') or '0.0.0.0'
-            print(f"🚀 MAGI {CONFIG['node_name']} server started (threaded)")
-            print(f"📡 Access dashboard: http://{bind}:{CONFIG['port']}")
-            if CONFIG.get('require_api_key'):
-                print('🔒 API key enforcement enabled. Use Authorization: Bearer <API_KEY>')
-            print('Press Ctrl+C to stop')
-            print('=' * 50)
-            httpd.serve_forever()
+        if CONFIG.get('server_mode') == 'asyncio':
+            print_banner('asyncio')
+            AsyncMAGIServer().serve_forever(CONFIG.get('bind_address', ''), CONFIG['port'])
+        else:
+            with MAGIServer((CONFIG.get('bind_address', ''), CONFIG['port']), MAGIHandler) as httpd:
+                print_banner(f"{CONFIG['worker_threads']} workers")
+                httpd.serve_forever()
     except KeyboardInterrupt:
         print(f"\n🛑 MAGI {CONFIG['node_name']} server stopped")
     except Exception as e: